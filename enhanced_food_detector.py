@@ -4,6 +4,16 @@ from ultralytics import YOLO
 import numpy as np
 import time
 import os
+import shutil
+import subprocess
+import sys
+import heapq
+import queue
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
 from typing import List, Dict, Tuple
 import logging
 from google_sheets_integration import GoogleSheetsManager
@@ -12,37 +22,170 @@ from google_sheets_integration import GoogleSheetsManager
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Con tamaño de entrada fijo (640x640) el autotuner de cuDNN puede elegir
+# los kernels más rápidos (incluidos los NHWC de tensor cores) una sola vez
+if torch.cuda.is_available():
+    torch.backends.cudnn.benchmark = True
+
+# Dtype compacto para las columnas numéricas de cada detección: el buffer
+# preasignado se rellena por columnas (sin dicts intermedios) y se convierte
+# a tipos nativos de Python en una sola pasada con tolist()
+class _FFmpegVideoWriter:
+    """
+    Writer de video que canaliza frames BGR crudos a un proceso ffmpeg
+
+    Misma interfaz write()/release() que cv2.VideoWriter; libx264 con
+    preset ultrafast acepta frames bastante más rápido que el encoder
+    mp4v por defecto de OpenCV, así el hilo de escritura no se atasca.
+    """
+
+    def __init__(self, path, fps, width, height):
+        self._proc = subprocess.Popen(
+            ['ffmpeg', '-y', '-loglevel', 'error',
+             '-f', 'rawvideo', '-pix_fmt', 'bgr24',
+             '-s', f'{width}x{height}', '-r', str(fps), '-i', '-',
+             '-c:v', 'libx264', '-preset', 'ultrafast',
+             '-pix_fmt', 'yuv420p', path],
+            stdin=subprocess.PIPE, bufsize=10 ** 8)
+
+    def write(self, frame):
+        self._proc.stdin.write(frame.tobytes())
+
+    def release(self):
+        try:
+            self._proc.stdin.close()
+            self._proc.wait(timeout=30)
+        except Exception:
+            self._proc.kill()
+
+
+@lru_cache(maxsize=512)
+def _text_size(label, font_scale, thickness):
+    """Métricas de texto memoizadas: las etiquetas se repiten entre frames"""
+    return cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)[0]
+
+
+_DETECTION_DTYPE = np.dtype([
+    ('class_id', 'i2'), ('conf', 'f4'),
+    ('x1', 'i2'), ('y1', 'i2'), ('x2', 'i2'), ('y2', 'i2'),
+    ('area', 'i4'),
+    ('donut', '?'), ('cake', '?'), ('lata', '?'),
+])
+
 class EnhancedFoodObjectDetector:
     """
     Detector mejorado que incluye alimentos y objetos relacionados como botellas, latas, etc.
     """
     
-    def __init__(self, model_path: str = "yolov8n.pt", confidence_threshold: float = 0.4, 
-                 video_source=None, output_video_path: str = None):
+    def __init__(self, model_path: str = "yolov8n.pt", confidence_threshold: float = 0.4,
+                 video_source=None, output_video_path: str = None, batch_size: int = 1,
+                 vid_stride: int = 1, display: bool = True):
         """
         Inicializar el detector mejorado
-        
+
         Args:
             model_path: Ruta al modelo YOLO
             confidence_threshold: Umbral de confianza (más bajo para detectar más objetos)
             video_source: Ruta del video de entrada (None para cámara)
             output_video_path: Ruta del video de salida con detecciones
+            batch_size: Frames por lote de inferencia (>1 aprovecha paralelismo GPU)
+            vid_stride: Procesar con YOLO solo 1 de cada N frames (1 = todos)
+            display: Mostrar la ventana de previsualización (False = headless)
         """
         self.confidence_threshold = confidence_threshold
         self.model = None
         self.video_source = video_source
         self.output_video_path = output_video_path
         self.video_writer = None
+        self.batch_size = max(1, batch_size)
+        self.vid_stride = max(1, vid_stride)
+        self.display = display
+
+        # Solo inferencia: sin autograd no se reserva metadata de gradientes
+        torch.set_grad_enabled(False)
+
+        # Sufijo de logging precalculado (evita basename por cada registro)
+        self._video_basename = os.path.basename(video_source) if video_source else None
+        self._video_info = f" (VIDEO: {self._video_basename})" if self._video_basename else ""
+
+        # Buffers pinned/GPU para subir lotes con copia asíncrona (se
+        # asignan de forma perezosa al conocer el tamaño del frame)
+        self._pinned = None
+        self._gpu = None
+        self._copy_stream = torch.cuda.Stream() if torch.cuda.is_available() else None
+
+        # Resolución nativa de inferencia: re-escalamos nosotros una sola
+        # vez (con buffers reutilizables) en lugar del letterbox interno de
+        # Ultralytics por frame; las cajas se re-proyectan al tamaño original
+        self._infer_size = (640, 640)
+        self._resize_bufs = []
+
+        # Escena de inventario mayormente estática: miniatura gris 32x32 del
+        # último frame inferido para saltar YOLO cuando el frame no cambió
+        self._prev_thumb = None
+        self._static_diff_threshold = 3.0
+
+        # Buffer estructurado reutilizado para las detecciones filtradas de
+        # cada frame (crece bajo demanda si un frame supera los 300 objetos)
+        self._dets_buf = np.empty(300, dtype=_DETECTION_DTYPE)
         
         # Definir todas las clases relevantes del dataset COCO
         self.target_classes = self._get_target_classes()
+        self._target_class_ids_np = np.array(list(self.target_classes.keys()), dtype=np.int32)
+
+        # Tabla de umbrales indexada directamente por class_id: las clases
+        # fuera de interés quedan en inf, así el filtro de clase y el de
+        # confianza se hacen en una sola comparación vectorizada
+        self._thresholds_by_cls = np.full(256, np.inf, dtype=np.float32)
+        for cid, info in self.target_classes.items():
+            self._thresholds_by_cls[cid] = self._get_threshold_by_priority(info['priority'])
         
         # Cargar modelo YOLO
         self._load_model(model_path)
         
         # Colores para las categorías
         self.colors = self._generate_colors()
-        
+
+        # Constantes de dibujado reutilizadas en cada frame (evitar recrearlas)
+        self._FONT = cv2.FONT_HERSHEY_SIMPLEX
+        self._WHITE = (255, 255, 255)
+        self._HUD_INSTRUCTIONS = "q:salir | s:screenshot | c:estadisticas | i:inventario | r:registrar | t:tracking"
+        # Plantillas %-style del HUD: solo se interpolan los valores que
+        # cambian en lugar de reconstruir f-strings completas por frame
+        self._HUD_HEADER_TMPL = "Frame: %d | Total detectado: %d"
+        self._HUD_OBJECTS_TMPL = "Objetos actuales: %d"
+        self._HUD_CAT_TMPL = "%s: %d"
+        self._hud_prefix_cache = None
+        self._hud_prefix_state = None
+
+        # Mapeo directo nombre -> (emoji, etiqueta) para detecciones
+        # mejoradas: una búsqueda de dict en lugar de chequeos de subcadena
+        # por detección en cada frame
+        self._enhanced_label_tags = {
+            'galleta (tipo donut)': ('🍪', 'GALLETA'),
+            'galleta (tipo cake)': ('🍪', 'GALLETA'),
+            'lata (refresco/bebida)': ('🥤', 'LATA'),
+        }
+
+        # Con OpenCL disponible, el render del overlay usa la T-API (UMat)
+        # para rasterizar los textos en GPU/iGPU
+        try:
+            self.use_umat = bool(cv2.ocl.haveOpenCL())
+        except Exception:
+            self.use_umat = False
+
+        # Overlay de tracking cacheado: se re-renderiza solo cuando cambia
+        # el estado del tracking o cada 15 frames (los contadores del HUD
+        # no necesitan refrescarse más rápido para el ojo humano)
+        self._tracking_overlay = None
+        self._tracking_overlay_frame = -1
+        self._tracking_dirty = True
+
+        # Capa de HUD cacheada: en cámara el texto se re-renderiza a media
+        # cadencia y los frames intermedios la componen con un solo add,
+        # para que el overlay no parpadee
+        self._info_overlay = None
+
         # Inicializar manager directo de Google Sheets para inventario
         self.sheets_manager = GoogleSheetsManager()
         if self.sheets_manager.is_connected:
@@ -50,28 +193,90 @@ class EnhancedFoodObjectDetector:
         else:
             logger.warning("⚠️ Google Sheets Manager no disponible - solo tracking local")
         
+        # Cola + worker en segundo plano para sinónimos: el loop de
+        # detección solo encola; la escritura (en lote) sale de otro hilo
+        self._synonym_q = queue.Queue()
+        threading.Thread(target=self._synonym_worker, daemon=True).start()
+
+        # Hilo dedicado de inferencia: permite post-procesar/dibujar el lote
+        # anterior mientras el modelo corre sobre el siguiente (el modelo
+        # libera el GIL durante la predicción)
+        self._inf_pool = ThreadPoolExecutor(max_workers=1)
+
+        # Hilo para E/S de disco (screenshots): la codificación JPEG y la
+        # escritura del .txt no frenan el frame siguiente
+        self._io_pool = ThreadPoolExecutor(max_workers=1)
+
+        # Cola acotada + worker para las mutaciones de inventario (registro,
+        # cantidad, eliminación): el RTT de Sheets deja de frenar frames
+        self._sheets_q = queue.Queue(maxsize=512)
+        threading.Thread(target=self._sheets_worker, daemon=True).start()
+
         # Contador para evitar registros duplicados
         self._last_detection_time = {}
         self._detection_cooldown = 5.0  # segundos entre detecciones del mismo objeto
         
         # Sistema de tracking inteligente para inventario
+        # Los umbrales cuentan frames *procesados* por YOLO, así que se
+        # escalan con vid_stride para que el comportamiento temporal del
+        # tracking no dependa del salto de frames
         self._tracked_objects = {}  # {object_key: object_info}
         self._frame_counter = 0
-        self._disappearance_threshold = 100  # frames para considerar objeto desaparecido
-        self._min_frames_for_registration = 30  # frames mínimos para confirmar objeto
+        self._disappearance_threshold = max(1, 100 // self.vid_stride)  # frames para considerar objeto desaparecido
+        self._min_frames_for_registration = max(1, 30 // self.vid_stride)  # frames mínimos para confirmar objeto
+        self._last_detections = []  # últimas detecciones, para frames saltados
+        self._expiry_heap = []  # (frame_de_expiración, object_key, last_seen_frame)
+        self._frame_obj_cache = {}  # dict reutilizado por _update_tracked_objects
         
         logger.info("🎯 Sistema de tracking inteligente inicializado")
         
     def _load_model(self, model_path: str):
-        """Cargar el modelo YOLO"""
+        """Cargar el modelo YOLO, reutilizando un engine TensorRT si existe"""
         try:
+            engine_path = os.path.splitext(model_path)[0] + ".engine"
+
+            # Reutilizar un engine TensorRT ya exportado (misma API de Ultralytics)
+            if os.path.exists(engine_path):
+                logger.info(f"Cargando engine TensorRT: {engine_path}")
+                self.model = YOLO(engine_path)
+                logger.info("Engine TensorRT cargado exitosamente")
+                return
+
             logger.info(f"Cargando modelo YOLO: {model_path}")
             self.model = YOLO(model_path)
             logger.info("Modelo cargado exitosamente")
+
+            # Detectar de inmediato cualquier ID fuera del mapeo del modelo
+            model_names = getattr(self.model, 'names', None)
+            if model_names:
+                unknown_ids = [cid for cid in self.target_classes if cid not in model_names]
+                if unknown_ids:
+                    logger.warning(f"⚠️ IDs de clase no presentes en el modelo: {unknown_ids}")
+
+            # Con GPU disponible, exportar a TensorRT FP16 una sola vez;
+            # las siguientes ejecuciones cargan el engine directamente
+            if torch.cuda.is_available():
+                try:
+                    logger.info("Exportando modelo a TensorRT FP16 (solo la primera vez)...")
+                    self.model.export(format="engine", half=True, dynamic=True,
+                                      batch=self.batch_size)
+                    self.model = YOLO(engine_path)
+                    logger.info(f"✅ Engine TensorRT generado y cargado: {engine_path}")
+                except Exception as e:
+                    logger.warning(f"⚠️ Export a TensorRT falló, se usa el modelo PyTorch: {e}")
+                    # Fallback PyTorch: FP16 + layout channels_last para que
+                    # cuDNN despache kernels NHWC de tensor cores (Ampere+)
+                    try:
+                        self.model.model = self.model.model.half().to(
+                            memory_format=torch.channels_last)
+                        logger.info("Modelo PyTorch en FP16 con layout channels_last")
+                    except Exception as e2:
+                        logger.warning(f"⚠️ No se pudo aplicar channels_last/FP16: {e2}")
+
         except Exception as e:
             logger.error(f"Error al cargar el modelo: {e}")
             raise
-    
+
     def _get_target_classes(self) -> Dict[int, Dict]:
         """
         Definir todas las clases objetivo con categorías
@@ -99,7 +304,6 @@ class EnhancedFoodObjectDetector:
             # === SNACKS Y PAQUETES ===
             # Note: COCO no tiene clases específicas para bolsas de snacks o cajas de jugo
             # Pero podemos detectar objetos similares
-            67: {'name': 'cell_phone', 'category': 'contexto', 'priority': 'low'},  
             73: {'name': 'laptop', 'category': 'contexto', 'priority': 'low'},      # contexto de comida en escritorio
             76: {'name': 'keyboard', 'category': 'contexto', 'priority': 'low'},    # contexto de snacking
             84: {'name': 'book', 'category': 'contexto', 'priority': 'low'},        # contexto de snacking mientras estudia
@@ -110,13 +314,7 @@ class EnhancedFoodObjectDetector:
             66: {'name': 'knife', 'category': 'utensilio', 'priority': 'low'},
             67: {'name': 'spoon', 'category': 'utensilio', 'priority': 'low'},
         }
-        
-        # Corregir IDs duplicados
-        target_classes[64] = {'name': 'bowl', 'category': 'utensilio', 'priority': 'medium'}
-        target_classes[65] = {'name': 'fork', 'category': 'utensilio', 'priority': 'low'}
-        target_classes[66] = {'name': 'knife', 'category': 'utensilio', 'priority': 'low'}
-        target_classes[67] = {'name': 'spoon', 'category': 'utensilio', 'priority': 'low'}
-        
+
         return target_classes
     
     def _generate_colors(self) -> Dict[str, Tuple[int, int, int]]:
@@ -137,12 +335,38 @@ class EnhancedFoodObjectDetector:
         """Inicializar fuente de video (cámara o archivo)"""
         try:
             if self.video_source is None:
-                # Usar cámara
-                self.cap = cv2.VideoCapture(0)
-                logger.info("Usando cámara web como fuente de video")
+                # Usar cámara (backend V4L2 en Linux para menor costo de captura)
+                self.cap = cv2.VideoCapture(0, cv2.CAP_V4L2)
+                if not self.cap.isOpened():
+                    self.cap = cv2.VideoCapture(0)
+
+                # Configuración de baja latencia: buffer mínimo para no acumular
+                # frames viejos y MJPG para decodificación acelerada (libjpeg-turbo)
+                self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+                self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+                logger.info("Usando cámara web como fuente de video (buffer=1, MJPG)")
             else:
-                # Usar archivo de video
-                self.cap = cv2.VideoCapture(self.video_source)
+                # Usar archivo de video, pidiendo decodificación por hardware
+                # (NVDEC/VAAPI vía FFmpeg) cuando el build de OpenCV lo soporta;
+                # si no, se cae a la decodificación normal por CPU
+                self.cap = None
+                if hasattr(cv2, 'CAP_PROP_HW_ACCELERATION'):
+                    try:
+                        self.cap = cv2.VideoCapture(
+                            self.video_source, cv2.CAP_FFMPEG,
+                            [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+                        )
+                        if self.cap.isOpened():
+                            logger.info("🎞️ Decodificación de video acelerada por hardware activa")
+                        else:
+                            self.cap.release()
+                            self.cap = None
+                    except Exception as e:
+                        logger.warning(f"⚠️ Decodificación por hardware no disponible: {e}")
+                        self.cap = None
+
+                if self.cap is None:
+                    self.cap = cv2.VideoCapture(self.video_source)
                 logger.info(f"Usando archivo de video: {self.video_source}")
             
             if not self.cap.isOpened():
@@ -155,20 +379,50 @@ class EnhancedFoodObjectDetector:
             self.fps = self.cap.get(cv2.CAP_PROP_FPS)
             self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
             
+            # Anillo de buffers de captura preasignados: cap.read(buf)
+            # decodifica sobre memoria reutilizada en lugar de asignar un
+            # frame nuevo por iteración. Un solo buffer no alcanza porque el
+            # pipeline mantiene frames en vuelo (colas de lectura/escritura,
+            # lote parcial acumulándose, el lote dentro del hilo de
+            # inferencia y las salidas del lote anterior todavía por
+            # encolar), así que el anillo cubre ese máximo con holgura.
+            if self.frame_width > 0 and self.frame_height > 0:
+                ring_size = 2 * 8 + 3 * self.batch_size + 4
+                self._frame_ring = [
+                    np.empty((self.frame_height, self.frame_width, 3), np.uint8)
+                    for _ in range(ring_size)
+                ]
+            else:
+                self._frame_ring = None
+            self._frame_ring_idx = 0
+
             logger.info(f"Video: {self.frame_width}x{self.frame_height} @ {self.fps} FPS")
             if self.video_source:
                 logger.info(f"Total frames: {self.total_frames}")
             
-            # Configurar video writer si se especifica salida
+            # Configurar video writer si se especifica salida: ffmpeg por
+            # pipe cuando el binario está disponible, cv2.VideoWriter si no
             if self.output_video_path:
-                fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-                self.video_writer = cv2.VideoWriter(
-                    self.output_video_path, 
-                    fourcc, 
-                    self.fps if self.fps > 0 else 30.0, 
-                    (self.frame_width, self.frame_height)
-                )
-                logger.info(f"Video de salida configurado: {self.output_video_path}")
+                out_fps = self.fps if self.fps > 0 else 30.0
+                if shutil.which('ffmpeg'):
+                    try:
+                        self.video_writer = _FFmpegVideoWriter(
+                            self.output_video_path, out_fps,
+                            self.frame_width, self.frame_height)
+                        logger.info(f"Video de salida vía ffmpeg (libx264 ultrafast): "
+                                    f"{self.output_video_path}")
+                    except Exception as e:
+                        logger.warning(f"⚠️ No se pudo lanzar ffmpeg, usando cv2.VideoWriter: {e}")
+                        self.video_writer = None
+                if self.video_writer is None:
+                    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+                    self.video_writer = cv2.VideoWriter(
+                        self.output_video_path,
+                        fourcc,
+                        out_fps,
+                        (self.frame_width, self.frame_height)
+                    )
+                    logger.info(f"Video de salida configurado: {self.output_video_path}")
             
             return True
             
@@ -178,58 +432,223 @@ class EnhancedFoodObjectDetector:
     
     def detect_objects(self, frame: np.ndarray) -> Tuple[np.ndarray, List[Dict]]:
         """
-        Detectar objetos relacionados con alimentos
+        Detectar objetos relacionados con alimentos en un frame individual
         """
-        detections = []
-        
-        try:
-            # Realizar predicción
-            results = self.model(frame, verbose=False)
-            
-            # Procesar resultados
-            for result in results:
+        return self.detect_objects_batch([frame])[0]
+
+    def detect_objects_batch(self, frames: List[np.ndarray]) -> List[Tuple[np.ndarray, List[Dict]]]:
+        """
+        Detectar objetos en un lote de frames con una sola llamada al modelo
+
+        Enviar varios frames juntos aprovecha el paralelismo de la GPU;
+        los resultados se procesan después frame por frame para mantener
+        el tracking en orden.
+        """
+        static_flags, results = self._prepare_and_infer(frames)
+        return self._postprocess_batch(frames, static_flags, results)
+
+    def _prepare_and_infer(self, frames: List[np.ndarray]):
+        """
+        Pre-procesar un lote y ejecutar el modelo (sin tocar el tracking)
+
+        Separado del post-procesado para poder correr en el hilo de
+        inferencia mientras el hilo principal dibuja el lote anterior.
+        Devuelve (static_flags, results); results es None si falló la
+        predicción y [] si todos los frames eran estáticos.
+        """
+        # Descartar frames estáticos: si la miniatura gris 32x32 casi no
+        # cambió desde el último frame inferido, se reutilizan sus
+        # detecciones y el frame no pasa por YOLO
+        static_flags = []
+        for frame in frames:
+            thumb = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY),
+                               (32, 32), interpolation=cv2.INTER_AREA)
+            is_static = (self._prev_thumb is not None and
+                         np.mean(np.abs(thumb.astype(np.int16) - self._prev_thumb))
+                         < self._static_diff_threshold)
+            if not is_static:
+                self._prev_thumb = thumb.astype(np.int16)
+            static_flags.append(is_static)
+
+        # Re-escalar al tamaño de inferencia reutilizando los buffers
+        # (solo los frames que realmente se van a inferir)
+        infer_frames = []
+        for i, (frame, is_static) in enumerate(zip(frames, static_flags)):
+            if is_static:
+                continue
+            if frame.shape[1::-1] == self._infer_size:
+                infer_frames.append(frame)
+                continue
+            slot = len(infer_frames)
+            if slot >= len(self._resize_bufs):
+                self._resize_bufs.append(
+                    np.empty((self._infer_size[1], self._infer_size[0], 3), np.uint8))
+            cv2.resize(frame, self._infer_size, dst=self._resize_bufs[slot],
+                       interpolation=cv2.INTER_AREA)
+            infer_frames.append(self._resize_bufs[slot])
+
+        if infer_frames:
+            try:
+                # Realizar predicción sobre el lote completo (subido a GPU con
+                # copia asíncrona desde memoria pinned cuando es posible);
+                # inference_mode evita versionado de tensores y autograd
+                with torch.inference_mode():
+                    results = self.model(self._stage_frames_for_inference(infer_frames),
+                                         verbose=False)
+            except Exception as e:
+                logger.error(f"Error en la detección: {e}")
+                results = None
+        else:
+            results = []
+
+        return static_flags, results
+
+    def _postprocess_batch(self, frames, static_flags, results):
+        """Extraer detecciones, dibujar y actualizar tracking (hilo principal)"""
+        if results is None:
+            return [(frame, []) for frame in frames]
+
+        results_iter = iter(results)
+        outputs = []
+        for frame, is_static in zip(frames, static_flags):
+            if is_static:
+                # Frame sin cambios: mismas detecciones, solo avanza el tracking
+                detections = self._last_detections
+                frame = self._draw_all(frame, detections)
+                self._update_tracked_objects(detections)
+                outputs.append((frame, detections))
+                continue
+
+            result = next(results_iter)
+            detections = []
+
+            try:
                 boxes = result.boxes
-                if boxes is not None:
-                    for box in boxes:
-                        confidence = float(box.conf)
-                        class_id = int(box.cls)
-                        
-                        # Verificar si es una clase de interés
-                        if class_id in self.target_classes:
-                            class_info = self.target_classes[class_id]
-                            
-                            # Ajustar umbral según prioridad
-                            threshold = self._get_threshold_by_priority(class_info['priority'])
-                            
-                            if confidence >= threshold:
-                                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                                
-                                detection_info = {
-                                    'class_id': class_id,
-                                    'class_name': class_info['name'],
-                                    'category': class_info['category'],
-                                    'priority': class_info['priority'],
-                                    'confidence': confidence,
-                                    'bbox': (x1, y1, x2, y2),
-                                    'area': (x2 - x1) * (y2 - y1)
-                                }
-                                
-                                # Mejorar detección de galletas y latas
-                                detection_info = self._enhance_food_detection(detection_info)
-                                
-                                detections.append(detection_info)
-                                
-                                # Dibujar la detección
-                                frame = self._draw_detection(frame, detection_info)
-            
-            # Actualizar sistema de tracking inteligente
-            self._update_tracked_objects(detections)
-            
-        except Exception as e:
-            logger.error(f"Error en la detección: {e}")
-        
-        return frame, detections
+                if boxes is not None and len(boxes) > 0:
+                    # Extraer todas las cajas de una vez: una sola
+                    # sincronización GPU→CPU por frame en lugar de una por caja
+                    xyxy = boxes.xyxy.cpu().numpy()
+
+                    # Re-proyectar las cajas a las coordenadas del frame original
+                    if frame.shape[1::-1] != self._infer_size:
+                        sx = frame.shape[1] / self._infer_size[0]
+                        sy = frame.shape[0] / self._infer_size[1]
+                        xyxy = xyxy * np.array([sx, sy, sx, sy])
+
+                    xyxy = xyxy.astype(np.int32)
+                    confs = boxes.conf.cpu().numpy()
+                    clses = boxes.cls.cpu().numpy().astype(np.int32)
+                    areas = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+
+                    # Heurísticas de galletas/latas evaluadas para todas las
+                    # cajas de una sola pasada
+                    galleta_donut, galleta_cake, lata = self._enhance_food_detection_masks(
+                        clses, xyxy, areas)
+
+                    # Filtro fusionado: clase de interés y confianza sobre el
+                    # umbral de su prioridad en una sola comparación
+                    mask = confs >= self._thresholds_by_cls[np.clip(clses, 0, 255)]
+
+                    # Volcar las filas que pasan el filtro al buffer
+                    # estructurado por columnas; una sola conversión C a
+                    # tipos nativos en lugar de int()/float() por campo
+                    sel = np.flatnonzero(mask)
+                    n = len(sel)
+                    if n > len(self._dets_buf):
+                        self._dets_buf = np.empty(
+                            max(n, 2 * len(self._dets_buf)), dtype=_DETECTION_DTYPE)
+                    buf = self._dets_buf[:n]
+                    buf['class_id'] = clses[sel]
+                    buf['conf'] = confs[sel]
+                    buf['x1'] = xyxy[sel, 0]
+                    buf['y1'] = xyxy[sel, 1]
+                    buf['x2'] = xyxy[sel, 2]
+                    buf['y2'] = xyxy[sel, 3]
+                    buf['area'] = areas[sel]
+                    buf['donut'] = galleta_donut[sel]
+                    buf['cake'] = galleta_cake[sel]
+                    buf['lata'] = lata[sel]
+
+                    for (class_id, confidence, x1, y1, x2, y2, area,
+                         es_donut, es_cake, es_lata) in buf.tolist():
+                        class_info = self.target_classes[class_id]
+
+                        detection_info = {
+                            'class_id': class_id,
+                            'class_name': class_info['name'],
+                            'category': class_info['category'],
+                            'priority': class_info['priority'],
+                            'confidence': confidence,
+                            'bbox': (x1, y1, x2, y2),
+                            'area': area
+                        }
+
+                        # Mejorar detección de galletas y latas (máscaras
+                        # precalculadas arriba)
+                        if es_donut:
+                            detection_info['class_name'] = 'galleta (tipo donut)'
+                            detection_info['enhanced'] = True
+                        elif es_cake:
+                            detection_info['class_name'] = 'galleta (tipo cake)'
+                            detection_info['enhanced'] = True
+                        elif es_lata:
+                            detection_info['class_name'] = 'lata (refresco/bebida)'
+                            detection_info['category'] = 'bebida_contenedor'
+                            detection_info['enhanced'] = True
+
+                        detections.append(detection_info)
+
+                # Dibujar todas las detecciones del frame en pasadas agrupadas
+                frame = self._draw_all(frame, detections)
+
+                # Actualizar sistema de tracking inteligente
+                self._update_tracked_objects(detections)
+
+            except Exception as e:
+                logger.error(f"Error en la detección: {e}")
+
+            self._last_detections = detections
+            outputs.append((frame, detections))
+
+        return outputs
     
+    def _stage_frames_for_inference(self, frames: List[np.ndarray]):
+        """
+        Subir el lote a GPU con copia asíncrona desde memoria pinned
+
+        La transferencia H2D se emite en un stream dedicado, de modo que se
+        solapa con la inferencia del lote anterior. Devuelve la lista
+        original (ruta normal de Ultralytics) si no hay GPU o si el tamaño
+        del frame no es múltiplo de 32, que es lo que exige el modelo para
+        recibir tensores directamente.
+        """
+        if self._copy_stream is None:
+            return frames
+
+        h, w = frames[0].shape[:2]
+        if h % 32 or w % 32 or any(f.shape[:2] != (h, w) for f in frames):
+            return frames
+
+        n = len(frames)
+        if (self._pinned is None or self._pinned.shape[0] < n
+                or self._pinned.shape[2:] != (h, w)):
+            self._pinned = torch.empty((max(n, self.batch_size), 3, h, w),
+                                       dtype=torch.float32, pin_memory=True)
+            self._gpu = torch.empty_like(self._pinned, device='cuda')
+
+        # Llenar el buffer pinned en CPU (BGR→RGB y HWC→CHW)
+        for i, frame in enumerate(frames):
+            rgb = np.ascontiguousarray(frame[:, :, ::-1])
+            self._pinned[i].copy_(torch.from_numpy(rgb).permute(2, 0, 1))
+
+        with torch.cuda.stream(self._copy_stream):
+            self._gpu[:n].copy_(self._pinned[:n], non_blocking=True)
+        torch.cuda.current_stream().wait_stream(self._copy_stream)
+
+        batch = self._gpu[:n]
+        batch.div_(255.0)
+        return batch
+
     def _get_threshold_by_priority(self, priority: str) -> float:
         """Obtener umbral de confianza según prioridad"""
         thresholds = {
@@ -239,74 +658,66 @@ class EnhancedFoodObjectDetector:
         }
         return thresholds.get(priority, self.confidence_threshold)
     
-    def _enhance_food_detection(self, detection: Dict) -> Dict:
+    def _enhance_food_detection_masks(self, clses: np.ndarray, xyxy: np.ndarray,
+                                      areas: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
         Mejorar la detección de galletas y latas basándose en características del objeto
+
+        Evalúa las heurísticas sobre todas las cajas del frame con máscaras
+        NumPy en lugar de comparar caja por caja en Python. Devuelve las
+        máscaras (galleta_donut, galleta_cake, lata).
         """
+        widths = xyxy[:, 2] - xyxy[:, 0]
+        heights = xyxy[:, 3] - xyxy[:, 1]
+        aspect_ratios = heights / np.maximum(widths, 1)
+
         # === DETECCIÓN DE GALLETAS ===
-        # Si es un donut pequeño, podría ser una galleta
-        if detection['class_name'] == 'donut':
-            area = detection['area']
-            # Si el área es pequeña (menor a 5000 px²), probablemente sea una galleta
-            if area < 5000:
-                detection['class_name'] = 'galleta (tipo donut)'
-                detection['enhanced'] = True
-        
-        # Si es un cake muy pequeño, podría ser una galleta grande
-        elif detection['class_name'] == 'cake':
-            area = detection['area']
-            # Si el área es pequeña (menor a 8000 px²), podría ser una galleta grande
-            if area < 8000:
-                detection['class_name'] = 'galleta (tipo cake)'
-                detection['enhanced'] = True
-        
+        # Un donut pequeño (área menor a 5000 px²) probablemente sea una galleta
+        galleta_donut = (clses == 54) & (areas < 5000)
+
+        # Un cake pequeño (área menor a 8000 px²) podría ser una galleta grande
+        galleta_cake = (clses == 55) & (areas < 8000)
+
         # === DETECCIÓN DE LATAS ===
-        # Si es una bottle con proporciones de lata (más alta que ancha y área pequeña-mediana)
-        elif detection['class_name'] == 'bottle':
-            x1, y1, x2, y2 = detection['bbox']
-            width = x2 - x1
-            height = y2 - y1
-            area = detection['area']
-            aspect_ratio = height / width if width > 0 else 0
-            
-            # Características típicas de una lata:
-            # - Más alta que ancha (aspect_ratio > 1.2)
-            # - Área moderada (entre 2000 y 15000 px²)
-            # - No muy delgada ni muy ancha
-            if (1.2 < aspect_ratio < 3.0 and 
-                2000 < area < 15000 and 
-                30 < width < 150):
-                detection['class_name'] = 'lata (refresco/bebida)'
-                detection['category'] = 'bebida_contenedor'
-                detection['enhanced'] = True
-        
-        return detection
+        # Características típicas de una lata en una bottle detectada:
+        # - Más alta que ancha (aspect_ratio > 1.2)
+        # - Área moderada (entre 2000 y 15000 px²)
+        # - No muy delgada ni muy ancha
+        lata = ((clses == 39) &
+                (aspect_ratios > 1.2) & (aspect_ratios < 3.0) &
+                (areas > 2000) & (areas < 15000) &
+                (widths > 30) & (widths < 150))
+
+        return galleta_donut, galleta_cake, lata
     
-    def _generate_object_key(self, detection: Dict) -> str:
+    def _generate_object_key(self, detection: Dict) -> Tuple[str, str]:
         """Generar clave única para un objeto basada en su clase y categoría"""
-        class_name = detection['class_name']
-        category = detection['category']
-        
         # Para objetos del mismo tipo, usar solo el nombre de clase y categoría
-        # Esto permitirá agrupar todos los objetos similares bajo una sola entrada
-        return f"{category}_{class_name}"
+        # Esto permitirá agrupar todos los objetos similares bajo una sola entrada.
+        # Tupla en lugar de f-string: misma unicidad sin construir una cadena
+        # nueva por detección en cada frame
+        return (detection['category'], detection['class_name'])
     
     def _update_tracked_objects(self, detections: List[Dict]):
         """Actualizar el sistema de tracking de objetos"""
         self._frame_counter += 1
-        current_frame_objects = {}
-        
-        # Contar objetos por tipo en el frame actual
+
+        # Reutilizar el mismo dict entre frames en lugar de asignar uno nuevo
+        current_frame_objects = self._frame_obj_cache
+        current_frame_objects.clear()
+
+        # Contar objetos por tipo en el frame actual (un solo hash por detección)
         for detection in detections:
             if detection['priority'] in ['high', 'medium']:  # Solo productos importantes
                 object_key = self._generate_object_key(detection)
-                if object_key not in current_frame_objects:
+                entry = current_frame_objects.get(object_key)
+                if entry is None:
                     current_frame_objects[object_key] = {
                         'detection': detection,
                         'count': 1
                     }
                 else:
-                    current_frame_objects[object_key]['count'] += 1
+                    entry['count'] += 1
         
         # Procesar objetos detectados
         for object_key, frame_data in current_frame_objects.items():
@@ -317,6 +728,9 @@ class EnhancedFoodObjectDetector:
                 # Objeto ya existe - actualizar información
                 obj_info = self._tracked_objects[object_key]
                 obj_info['last_seen_frame'] = self._frame_counter
+                heapq.heappush(self._expiry_heap,
+                               (self._frame_counter + self._disappearance_threshold,
+                                object_key, self._frame_counter))
                 obj_info['total_detections'] += 1
                 obj_info['confidence_sum'] += detection['confidence']
                 obj_info['avg_confidence'] = obj_info['confidence_sum'] / obj_info['total_detections']
@@ -326,14 +740,17 @@ class EnhancedFoodObjectDetector:
                     # Aumentó la cantidad - registrar nuevas instancias
                     new_instances = current_count - obj_info['quantity']
                     obj_info['quantity'] = current_count
+                    self._tracking_dirty = True
                     self._register_additional_instances(detection, new_instances, obj_info)
-                    logger.info(f"📈 Cantidad aumentada: {detection['class_name']} "
-                              f"de {obj_info['quantity'] - new_instances} a {obj_info['quantity']}")
+                    logger.info("📈 Cantidad aumentada: %s de %d a %d",
+                                detection['class_name'],
+                                obj_info['quantity'] - new_instances, obj_info['quantity'])
                 elif current_count < obj_info['quantity']:
                     # Disminuyó la cantidad - actualizar pero no eliminar aún
                     obj_info['quantity'] = current_count
-                    logger.info(f"📉 Cantidad disminuida: {detection['class_name']} "
-                              f"a {obj_info['quantity']}")
+                    self._tracking_dirty = True
+                    logger.info("📉 Cantidad disminuida: %s a %d",
+                                detection['class_name'], obj_info['quantity'])
                     
             else:
                 # Nuevo objeto - inicializar tracking
@@ -348,160 +765,197 @@ class EnhancedFoodObjectDetector:
                     'registered': False,
                     'item_id': None  # Un solo ID para todo el grupo
                 }
-                logger.info(f"🆕 Nuevo objeto tracked: {detection['class_name']} "
-                          f"(cantidad inicial: {current_count})")
-        
+                heapq.heappush(self._expiry_heap,
+                               (self._frame_counter + self._disappearance_threshold,
+                                object_key, self._frame_counter))
+                self._tracking_dirty = True
+                logger.info("🆕 Nuevo objeto tracked: %s (cantidad inicial: %d)",
+                            detection['class_name'], current_count)
+
         # Verificar objetos que han desaparecido completamente
-        self._check_disappeared_objects(set(current_frame_objects.keys()))
+        self._check_disappeared_objects()
         
         # Registrar objetos que han sido confirmados
         self._register_confirmed_objects()
     
+    def _enqueue_sheets_op(self, op: tuple) -> bool:
+        """Encolar una mutación de inventario sin bloquear el loop de detección"""
+        try:
+            self._sheets_q.put_nowait(op)
+            return True
+        except queue.Full:
+            logger.warning("⚠️ Cola de Sheets llena - operación descartada")
+            return False
+
+    def _sheets_worker(self):
+        """Hilo que drena la cola de mutaciones de inventario hacia Sheets"""
+        while True:
+            ops = [self._sheets_q.get()]
+
+            # Drenar lo acumulado para poder coalescer escrituras
+            try:
+                while len(ops) < 32:
+                    ops.append(self._sheets_q.get_nowait())
+            except queue.Empty:
+                pass
+
+            # Coalescer actualizaciones de cantidad: del mismo item_id solo
+            # se escribe la última
+            latest_quantity = {}
+            pending = []
+            for op in ops:
+                if op[0] == 'update_quantity':
+                    if op[1] not in latest_quantity:
+                        pending.append(('update_quantity', op[1]))
+                    latest_quantity[op[1]] = op
+                else:
+                    pending.append(op)
+
+            for op in pending:
+                try:
+                    if op[0] == 'update_quantity':
+                        _, item_id, quantity, info = latest_quantity[op[1]]
+                        success = self.sheets_manager.update_item_quantity(
+                            item_id=item_id, new_quantity=quantity, additional_info=info)
+                        if success:
+                            logger.info(f"✅ Cantidad actualizada en Excel{self._video_info}: "
+                                      f"{item_id} ahora tiene {quantity} unidades")
+                        else:
+                            logger.warning(f"⚠️ No se pudo actualizar cantidad en inventario: {item_id}")
+                    elif op[0] == 'register':
+                        self._register_object_in_sheets(op[1], op[2])
+                    elif op[0] == 'manual_register':
+                        _, item_name, confidence, category, info = op
+                        success = self.sheets_manager.log_detection(
+                            item_name=item_name, confidence=confidence,
+                            additional_info=info)
+                        if success:
+                            last_item_id = self.sheets_manager.get_last_item_id()
+                            if last_item_id:
+                                self._add_automatic_synonyms(item_name, last_item_id, category)
+                            logger.info(f"✅ Registro manual completado: {item_name} (ID: {last_item_id})")
+                        else:
+                            logger.error(f"❌ Error en registro manual: {item_name}")
+                    elif op[0] == 'remove':
+                        _, item_id, item_name, reason = op
+                        self.sheets_manager.log_removal_to_bitacora(
+                            item_id=item_id, item_name=item_name, reason=reason)
+                        self.sheets_manager.remove_item_from_inventory(
+                            item_id=item_id, reason=reason)
+                        logger.info(f"🗑️ Objeto eliminado del inventario: {item_name} (ID: {item_id})")
+                except Exception as e:
+                    logger.error(f"❌ Error en escritura de inventario en segundo plano: {e}")
+                    # Un registro que reventó tampoco debe quedar marcado
+                    # como hecho: habilitar el reintento
+                    if op[0] == 'register':
+                        op[1]['registered'] = False
+
+    def _register_object_in_sheets(self, obj_info: Dict, additional_info: str):
+        """Registrar un objeto en el inventario (corre en el worker de Sheets)"""
+        detection = obj_info['detection']
+        item_name = detection['class_name']
+
+        success = self.sheets_manager.log_detection(
+            item_name=item_name,
+            confidence=obj_info['avg_confidence'],
+            quantity=obj_info['quantity'],
+            additional_info=additional_info
+        )
+
+        if success:
+            last_item_id = self.sheets_manager.get_last_item_id()
+            if last_item_id:
+                obj_info['item_id'] = last_item_id
+                self._add_automatic_synonyms(item_name, last_item_id, detection['category'])
+                logger.info(f"📦 Item registrado exitosamente en Excel{self._video_info}: "
+                          f"{item_name} con {obj_info['quantity']} unidades (ID: {last_item_id})")
+        else:
+            # La escritura falló: des-marcar el objeto para que el tracking
+            # vuelva a encolar su registro en un frame posterior
+            obj_info['registered'] = False
+            logger.warning(f"⚠️ Registro fallido, se reintentará: {item_name}")
+
     def _register_additional_instances(self, detection: Dict, new_instances: int, obj_info: Dict):
         """Actualizar cantidad de un objeto existente en lugar de crear nuevos registros"""
         if not self.sheets_manager.is_connected:
             return
-        
-        try:
-            item_name = detection['class_name']
-            confidence = obj_info['avg_confidence']
-            
-            # Si ya hay un item_id registrado, actualizar la cantidad
-            if obj_info['item_id']:
-                logger.info(f"📈 Actualizando cantidad: {item_name} (+{new_instances} unidades)")
-                
-                # Actualizar en el inventario usando el ID existente
-                success = self.sheets_manager.update_item_quantity(
-                    item_id=obj_info['item_id'],
-                    new_quantity=obj_info['quantity'],
-                    additional_info=f"Cantidad actualizada automáticamente - Frame: {self._frame_counter}"
-                )
-                
-                if success:
-                    video_info = f" (VIDEO: {os.path.basename(self.video_source)})" if self.video_source else ""
-                    logger.info(f"✅ Cantidad actualizada en Excel{video_info}: {item_name} ahora tiene {obj_info['quantity']} unidades (ID: {obj_info['item_id']})")
-                else:
-                    logger.warning(f"⚠️ No se pudo actualizar cantidad en inventario: {item_name}")
-            else:
-                # Si no hay ID aún, registrar por primera vez con la cantidad total
-                success = self.sheets_manager.log_detection(
-                    item_name=item_name,
-                    confidence=confidence,
-                    quantity=obj_info['quantity'],
-                    additional_info=f"Primera detección con cantidad {obj_info['quantity']} - Frame: {self._frame_counter}"
-                )
-                
-                if success:
-                    last_item_id = self.sheets_manager.get_last_item_id()
-                    if last_item_id:
-                        obj_info['item_id'] = last_item_id
-                        self._add_automatic_synonyms(item_name, last_item_id, detection['category'])
-                        video_info = f" (VIDEO: {os.path.basename(self.video_source)})" if self.video_source else ""
-                        logger.info(f"✅ Nuevo objeto registrado en Excel{video_info}: {item_name} con {obj_info['quantity']} unidades (ID: {last_item_id})")
-                
-        except Exception as e:
-            logger.error(f"❌ Error actualizando cantidad: {e}")
+
+        item_name = detection['class_name']
+
+        # Si ya hay un item_id registrado, encolar la actualización de cantidad
+        if obj_info['item_id']:
+            logger.info(f"📈 Actualizando cantidad: {item_name} (+{new_instances} unidades)")
+            self._enqueue_sheets_op((
+                'update_quantity', obj_info['item_id'], obj_info['quantity'],
+                f"Cantidad actualizada automáticamente - Frame: {self._frame_counter}"))
+        else:
+            # Si no hay ID aún, encolar el primer registro con la cantidad total
+            self._enqueue_sheets_op((
+                'register', obj_info,
+                f"Primera detección con cantidad {obj_info['quantity']} - Frame: {self._frame_counter}"))
     
-    def _check_disappeared_objects(self, current_frame_objects: set):
+    def _check_disappeared_objects(self):
         """Verificar y eliminar objetos que han desaparecido"""
-        disappeared_objects = []
-        
-        for object_key, obj_info in self._tracked_objects.items():
-            if object_key not in current_frame_objects:
-                frames_missing = self._frame_counter - obj_info['last_seen_frame']
-                
-                if frames_missing >= self._disappearance_threshold:
-                    # Objeto ha desaparecido - eliminar del inventario si estaba registrado
-                    if obj_info['registered'] and obj_info['item_id']:
-                        self._remove_disappeared_object(obj_info)
-                    
-                    disappeared_objects.append(object_key)
-                    logger.info(f"🗑️ Objeto desaparecido: {obj_info['detection']['class_name']} "
-                              f"(ausente por {frames_missing} frames, cantidad: {obj_info['quantity']})")
-        
-        # Eliminar objetos desaparecidos del tracking
-        for object_key in disappeared_objects:
+        # Heap de expiración con borrado perezoso: solo se inspeccionan los
+        # objetos cuyo plazo ya venció, en lugar de recorrer todo el tracking
+        # en cada frame. Las entradas obsoletas (objeto visto de nuevo después
+        # de encolarse) se reconocen porque su last_seen_frame ya no coincide.
+        while self._expiry_heap and self._expiry_heap[0][0] <= self._frame_counter:
+            _, object_key, seen_at = heapq.heappop(self._expiry_heap)
+
+            obj_info = self._tracked_objects.get(object_key)
+            if obj_info is None or obj_info['last_seen_frame'] != seen_at:
+                continue  # entrada obsoleta, el objeto sigue activo
+
+            frames_missing = self._frame_counter - obj_info['last_seen_frame']
+
+            # Objeto ha desaparecido - eliminar del inventario si estaba registrado
+            if obj_info['registered'] and obj_info['item_id']:
+                self._remove_disappeared_object(obj_info)
+
+            logger.info(f"🗑️ Objeto desaparecido: {obj_info['detection']['class_name']} "
+                      f"(ausente por {frames_missing} frames, cantidad: {obj_info['quantity']})")
             del self._tracked_objects[object_key]
+            self._tracking_dirty = True
     
     def _remove_disappeared_object(self, obj_info: Dict):
-        """Eliminar un objeto desaparecido del inventario"""
+        """Encolar la eliminación de un objeto desaparecido del inventario"""
         if not self.sheets_manager.is_connected:
             return
-        
-        try:
-            item_name = obj_info['detection']['class_name']
-            item_id = obj_info['item_id']
-            
-            if item_id:
-                # Registrar eliminación en bitácora
-                self.sheets_manager.log_removal_to_bitacora(
-                    item_id=item_id,
-                    item_name=item_name,
-                    reason="objeto_desaparecido_de_camara"
-                )
-                
-                # Eliminar del inventario
-                self.sheets_manager.remove_item_from_inventory(
-                    item_id=item_id,
-                    reason="objeto_desaparecido_de_camara"
-                )
-                
-                logger.info(f"🗑️ Objeto eliminado del inventario: {item_name} "
-                          f"({obj_info['quantity']} unidades, ID: {item_id})")
-            else:
-                logger.info(f"🗑️ Objeto desaparecido sin ID registrado: {item_name}")
-            
-        except Exception as e:
-            logger.error(f"❌ Error eliminando objeto desaparecido: {e}")
-    
+
+        item_name = obj_info['detection']['class_name']
+        item_id = obj_info['item_id']
+
+        if item_id:
+            self._enqueue_sheets_op(('remove', item_id, item_name,
+                                     "objeto_desaparecido_de_camara"))
+        else:
+            logger.info(f"🗑️ Objeto desaparecido sin ID registrado: {item_name}")
+
     def _register_confirmed_objects(self):
         """Registrar objetos que han sido confirmados por tiempo suficiente"""
+        if not self.sheets_manager.is_connected:
+            return
+
         for object_key, obj_info in self._tracked_objects.items():
-            if (not obj_info['registered'] and 
+            if (not obj_info['registered'] and
                 obj_info['total_detections'] >= self._min_frames_for_registration):
-                
-                # Objeto confirmado - registrar en inventario
-                if self._register_confirmed_object(obj_info):
-                    obj_info['registered'] = True
-                    video_info = f" (VIDEO: {os.path.basename(self.video_source)})" if self.video_source else ""
-                    logger.info(f"✅ Objeto confirmado y registrado en Excel{video_info}: {obj_info['detection']['class_name']} "
-                              f"(confianza promedio: {obj_info['avg_confidence']:.3f})")
-    
-    def _register_confirmed_object(self, obj_info: Dict) -> bool:
-        """Registrar un objeto confirmado en el inventario"""
-        if not self.sheets_manager.is_connected:
-            return False
-        
-        try:
-            detection = obj_info['detection']
-            item_name = detection['class_name']
-            confidence = obj_info['avg_confidence']
-            quantity = obj_info['quantity']
-            
-            additional_info = (f"Objeto confirmado después de {obj_info['total_detections']} detecciones. "
-                             f"Frames: {obj_info['first_seen_frame']}-{obj_info['last_seen_frame']}. "
-                             f"Cantidad: {quantity}")
-            
-            success = self.sheets_manager.log_detection(
-                item_name=item_name,
-                confidence=confidence,
-                quantity=quantity,
-                additional_info=additional_info
-            )
-            
-            if success:
-                last_item_id = self.sheets_manager.get_last_item_id()
-                if last_item_id:
-                    obj_info['item_id'] = last_item_id
-                    self._add_automatic_synonyms(item_name, last_item_id, detection['category'])
-                    video_info = f" (VIDEO: {os.path.basename(self.video_source)})" if self.video_source else ""
-                    logger.info(f"📦 Item registrado exitosamente en Excel{video_info}: {item_name} (ID: {last_item_id})")
-                    return True
-            
-        except Exception as e:
-            logger.error(f"❌ Error registrando objeto confirmado: {e}")
-        
-        return False
+
+                # Objeto confirmado - encolar registro (se marca ya como
+                # registrado para no re-encolarlo en frames siguientes)
+                obj_info['registered'] = True
+                self._tracking_dirty = True
+                additional_info = (f"Objeto confirmado después de {obj_info['total_detections']} detecciones. "
+                                 f"Frames: {obj_info['first_seen_frame']}-{obj_info['last_seen_frame']}. "
+                                 f"Cantidad: {obj_info['quantity']}")
+                if not self._enqueue_sheets_op(('register', obj_info, additional_info)):
+                    # Cola llena: des-marcar para reintentar en un frame
+                    # posterior; dejarlo "registrado" sin item_id haría que
+                    # su desaparición nunca se descontara del inventario
+                    obj_info['registered'] = False
+                    continue
+                logger.info(f"✅ Objeto confirmado, registro encolado{self._video_info}: {obj_info['detection']['class_name']} "
+                          f"(confianza promedio: {obj_info['avg_confidence']:.3f})")
     
     def _process_detection_for_inventory(self, detection: Dict) -> bool:
         """
@@ -596,61 +1050,132 @@ class EnhancedFoodObjectDetector:
             base_name = item_name.replace('_', ' ').replace('(', '').replace(')', '').strip()
             synonyms_to_add.append((base_name, item_id, category))
             
-            # Agregar sinónimos al spreadsheet
-            for synonym, syn_item_id, syn_category in synonyms_to_add:
-                self.sheets_manager.add_synonym(synonym, syn_item_id, syn_category)
-                time.sleep(0.2)  # Pausa para evitar rate limiting
-            
+            # Encolar para el worker en segundo plano: la escritura en lote
+            # no bloquea el loop de detección
+            for synonym_entry in synonyms_to_add:
+                self._synonym_q.put(synonym_entry)
+
         except Exception as e:
             logger.error(f"❌ Error agregando sinónimos automáticos: {e}")
+
+    def _synonym_worker(self):
+        """Hilo que vacía la cola de sinónimos en lotes hacia Google Sheets"""
+        while True:
+            batch = [self._synonym_q.get()]
+
+            # Drenar lo acumulado (hasta 50) antes de escribir
+            try:
+                while len(batch) < 50:
+                    batch.append(self._synonym_q.get(timeout=1.0))
+            except queue.Empty:
+                pass
+
+            try:
+                self.sheets_manager.add_synonyms_batch(batch)
+            except Exception as e:
+                logger.error(f"❌ Error agregando sinónimos en lote: {e}")
     
-    def _draw_detection(self, frame: np.ndarray, detection: Dict) -> np.ndarray:
-        """Dibujar una detección con información de categoría"""
-        x1, y1, x2, y2 = detection['bbox']
+    def _detection_color(self, detection: Dict) -> Tuple[int, int, int]:
+        """Color de dibujo para una detección según categoría"""
+        # Si es una detección mejorada de galleta/lata, usar color especial
+        if detection.get('enhanced', False):
+            return (0, 165, 255)  # Naranja brillante para detecciones mejoradas
+        return self.colors.get(detection['category'], (255, 255, 255))
+
+    def _draw_all(self, frame: np.ndarray, detections: List[Dict]) -> np.ndarray:
+        """
+        Dibujar todas las detecciones de un frame en pasadas agrupadas
+
+        Los rectángulos se agrupan por (color, grosor) y cada grupo se emite
+        con una sola llamada a cv2.polylines; las etiquetas siguen siendo por
+        caja porque putText no se puede batchear.
+        """
+        if not detections:
+            return frame
+
+        # Agrupar rectángulos por estilo de trazo
+        groups = {}
+        for detection in detections:
+            color = self._detection_color(detection)
+            thickness = {'high': 3, 'medium': 2, 'low': 1}[detection['priority']]
+            x1, y1, x2, y2 = detection['bbox']
+            groups.setdefault((color, thickness), []).append(
+                [[x1, y1], [x2, y1], [x2, y2], [x1, y2]])
+
+        for (color, thickness), polygons in groups.items():
+            cv2.polylines(frame, np.asarray(polygons, dtype=np.int32), True, color, thickness)
+
+        for detection in detections:
+            self._draw_label(frame, detection)
+
+        return frame
+
+    def _draw_label(self, frame: np.ndarray, detection: Dict):
+        """Dibujar la etiqueta de una detección con información de categoría"""
+        x1, y1 = detection['bbox'][:2]
         class_name = detection['class_name']
         category = detection['category']
-        priority = detection['priority']
         confidence = detection['confidence']
-        
-        # Color según categoría
-        color = self.colors.get(category, (255, 255, 255))
-        
-        # Si es una detección mejorada de galleta, usar color especial
-        if detection.get('enhanced', False):
-            color = (0, 165, 255)  # Naranja brillante para galletas detectadas
-        
-        # Grosor según prioridad
-        thickness = {'high': 3, 'medium': 2, 'low': 1}[priority]
-        
-        # Dibujar rectángulo
-        cv2.rectangle(frame, (x1, y1), (x2, y2), color, thickness)
-        
+        color = self._detection_color(detection)
+
         # Preparar texto con categoría
         label = f"{class_name} ({category}): {confidence:.2f}"
         if detection.get('enhanced', False):
-            if 'galleta' in class_name:
-                label = f"🍪 {label} [GALLETA]"
-            elif 'lata' in class_name:
-                label = f"🥤 {label} [LATA]"
-            else:
-                label = f"✨ {label} [MEJORADO]"
-        
-        # Calcular tamaño del texto
+            emoji, tag = self._enhanced_label_tags.get(class_name, ('✨', 'MEJORADO'))
+            label = f"{emoji} {label} [{tag}]"
+
+        # Calcular tamaño del texto (memoizado: la misma etiqueta se
+        # repite frame a frame)
         font = cv2.FONT_HERSHEY_SIMPLEX
         font_scale = 0.5
         text_thickness = 1
-        (text_width, text_height), _ = cv2.getTextSize(label, font, font_scale, text_thickness)
-        
-        # Dibujar fondo del texto
-        cv2.rectangle(frame, (x1, y1 - text_height - 10), (x1 + text_width, y1), color, -1)
-        
+        text_width, text_height = _text_size(label, font_scale, text_thickness)
+
+        # Dibujar fondo del texto: asignación directa del slice (rectángulo
+        # relleno alineado a ejes) en lugar del pipeline genérico de cv2;
+        # numpy recorta los límites derechos solo
+        y0 = max(0, y1 - text_height - 10)
+        if y1 > y0 and x1 >= 0:
+            frame[y0:y1, x1:x1 + text_width] = color
+
         # Dibujar texto
         cv2.putText(frame, label, (x1, y1 - 5), font, font_scale, (255, 255, 255), text_thickness)
-        
-        return frame
     
     def _draw_tracking_info(self, frame: np.ndarray) -> np.ndarray:
         """Dibujar información del sistema de tracking en el frame"""
+        try:
+            # Reutilizar el overlay renderizado mientras el estado del
+            # tracking no cambie: decenas de putText se vuelven un solo add
+            redraw = (self._tracking_overlay is None or
+                      self._tracking_dirty or
+                      self._tracking_overlay.shape != frame.shape or
+                      self._frame_counter - self._tracking_overlay_frame >= 15)
+            if redraw:
+                if (self._tracking_overlay is None or
+                        self._tracking_overlay.shape != frame.shape):
+                    self._tracking_overlay = np.zeros_like(frame)
+                else:
+                    self._tracking_overlay.fill(0)
+                if self.use_umat:
+                    # T-API: los putText corren vía OpenCL; la subida/bajada
+                    # se amortiza porque el overlay se renderiza pocas veces
+                    u = cv2.UMat(self._tracking_overlay)
+                    self._render_tracking_overlay(u)
+                    self._tracking_overlay = u.get()
+                else:
+                    self._render_tracking_overlay(self._tracking_overlay)
+                self._tracking_overlay_frame = self._frame_counter
+                self._tracking_dirty = False
+
+            cv2.add(frame, self._tracking_overlay, dst=frame)
+
+        except Exception as e:
+            logger.error(f"Error dibujando info de tracking: {e}")
+
+        return frame
+
+    def _render_tracking_overlay(self, frame: np.ndarray):
+        """Renderizar los textos de tracking sobre la capa del overlay"""
         try:
             # Información general del tracking
             tracking_info = [
@@ -672,26 +1197,26 @@ class EnhancedFoodObjectDetector:
                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 1)
                 y_offset += 20
                 
-                for i, (object_key, obj_info) in enumerate(self._tracked_objects.items()):
-                    if i >= 5:  # Máximo 5 objetos para no saturar pantalla
-                        cv2.putText(frame, f"... y {len(self._tracked_objects) - 5} más", 
-                                   (10, y_offset), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (128, 128, 128), 1)
-                        break
-                    
+                # Máximo 5 objetos para no saturar pantalla: islice corta la
+                # iteración sin recorrer el dict completo
+                total_tracked = len(self._tracked_objects)
+                for object_key, obj_info in islice(self._tracked_objects.items(), 5):
                     item_name = obj_info['detection']['class_name']
                     frames_active = self._frame_counter - obj_info['first_seen_frame']
                     frames_since_seen = self._frame_counter - obj_info['last_seen_frame']
                     status = "✅ REG" if obj_info['registered'] else "⏳ PEND"
                     
                     info_text = f"{status} {item_name} x{obj_info['quantity']} (activo:{frames_active}f, último:{frames_since_seen}f)"
-                    cv2.putText(frame, info_text, (10, y_offset), 
+                    cv2.putText(frame, info_text, (10, y_offset),
                                cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
                     y_offset += 15
-            
+
+                if total_tracked > 5:
+                    cv2.putText(frame, f"... y {total_tracked - 5} más",
+                               (10, y_offset), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (128, 128, 128), 1)
+
         except Exception as e:
-            logger.error(f"Error dibujando info de tracking: {e}")
-        
-        return frame
+            logger.error(f"Error renderizando overlay de tracking: {e}")
     
     def run_enhanced_detection(self):
         """Ejecutar detección mejorada en tiempo real o en video"""
@@ -727,156 +1252,325 @@ class EnhancedFoodObjectDetector:
         
         fps_counter = 0
         start_time = time.time()
-        detection_stats = {'total': 0, 'by_category': {}}
+        detection_stats = {'total': 0, 'by_category': Counter()}
         processed_frames = 0
         
-        try:
+        # Pipeline de 3 etapas: lectura y escritura en hilos propios para
+        # solapar la decodificación/codificación de OpenCV con la inferencia.
+        # El cómputo (tracking incluido) sigue en el hilo principal.
+        prefetch = 8
+        read_q = queue.Queue(maxsize=prefetch)
+        write_q = queue.Queue(maxsize=prefetch) if self.video_writer else None
+        pipeline_stop = threading.Event()
+
+        # Con video de entrada sin video de salida, los frames saltados por
+        # vid_stride no se infieren, no se escriben y no se muestran: basta
+        # grab() (avanza el demuxer) y nos ahorramos su decodificación, que
+        # domina el costo de CPU en archivos grandes. Con cámara o con
+        # writer el frame saltado sí se usa, así que se decodifica siempre.
+        reader_strides = (bool(self.video_source) and self.video_writer is None
+                          and self.vid_stride > 1)
+
+        def _reader():
+            raw_idx = 0
+            while not pipeline_stop.is_set():
+                if reader_strides and raw_idx % self.vid_stride != 0:
+                    ok = self.cap.grab()
+                    raw_idx += 1
+                    if ok:
+                        continue
+                    new_frame = None  # centinela de fin de stream
+                else:
+                    if self._frame_ring is not None:
+                        buf = self._frame_ring[self._frame_ring_idx]
+                        self._frame_ring_idx = (self._frame_ring_idx + 1) % len(self._frame_ring)
+                        ret, new_frame = self.cap.read(buf)
+                    else:
+                        ret, new_frame = self.cap.read()
+                    raw_idx += 1
+                    if not ret:
+                        new_frame = None  # centinela de fin de stream
+                while not pipeline_stop.is_set():
+                    try:
+                        read_q.put(new_frame, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if new_frame is None:
+                    break
+
+        def _writer():
             while True:
-                ret, frame = self.cap.read()
-                
-                if not ret:
+                out_frame = write_q.get()
+                if out_frame is None:
+                    break
+                self.video_writer.write(out_frame)
+
+        reader_thread = threading.Thread(target=_reader, daemon=True)
+        reader_thread.start()
+        writer_thread = None
+        if write_q is not None:
+            writer_thread = threading.Thread(target=_writer, daemon=True)
+            writer_thread.start()
+
+        try:
+            pending_frames = []
+            raw_frames = 0
+            stop = False
+            # Cadencia de display precalculada: contador simple en lugar de
+            # módulo + cadena booleana por frame
+            display_mod = 1 if not self.video_source else 5
+            display_tick = 0
+            inflight = None  # (lote, future) del lote en el hilo de inferencia
+            while not stop:
+                frame = read_q.get()
+                outputs = None
+                inferred = True
+
+                if frame is None:
                     if self.video_source:
                         logger.info("Procesamiento de video completado")
                     else:
                         logger.error("No se pudo leer el frame de la cámara")
-                    break
-                
-                processed_frames += 1
-                
-                # Detectar objetos
-                processed_frame, detections = self.detect_objects(frame)
-                
-                # Actualizar estadísticas
-                self._update_stats(detections, detection_stats)
-                
-                # Calcular FPS y progreso
-                fps_counter += 1
-                if fps_counter % 30 == 0:
-                    end_time = time.time()
-                    fps = 30 / (end_time - start_time)
-                    start_time = end_time
-                    
+                    stop = True
+                elif (not reader_strides and self.vid_stride > 1
+                      and raw_frames % self.vid_stride != 0):
+                    # Frame saltado por vid_stride: reutilizar las últimas
+                    # detecciones para el dibujado sin pagar la inferencia
+                    raw_frames += 1
+                    frame = self._draw_all(frame, self._last_detections)
+                    outputs = [(frame, self._last_detections)]
+                    inferred = False
+                else:
+                    # Acumular frames hasta completar el lote de inferencia
+                    raw_frames += 1
+                    pending_frames.append(frame)
+                    if len(pending_frames) < self.batch_size:
+                        continue
+
+                if outputs is None:
+                    if frame is not None and pending_frames:
+                        # Lote completo: lanzarlo al hilo de inferencia y
+                        # post-procesar el lote anterior mientras el modelo
+                        # corre sobre este (solapa dibujo/HUD con inferencia)
+                        batch = pending_frames
+                        pending_frames = []
+                        future = self._inf_pool.submit(self._prepare_and_infer, batch)
+                        prev, inflight = inflight, (batch, future)
+                        if prev is None:
+                            continue
+                        prev_batch, prev_future = prev
+                        outputs = self._postprocess_batch(prev_batch, *prev_future.result())
+                    else:
+                        # Fin de stream: drenar el lote en vuelo y el parcial
+                        outputs = []
+                        if inflight is not None:
+                            prev_batch, prev_future = inflight
+                            inflight = None
+                            outputs += self._postprocess_batch(prev_batch, *prev_future.result())
+                        if pending_frames:
+                            outputs += self.detect_objects_batch(pending_frames)
+                            pending_frames = []
+                        if not outputs:
+                            break
+
+                for processed_frame, detections in outputs:
+                    processed_frames += 1
+
+                    # Conteo por categoría calculado una sola vez por frame y
+                    # compartido entre estadísticas y HUD (antes cada uno
+                    # recorría las detecciones por su cuenta)
+                    cat_counts = None
+
+                    # Actualizar estadísticas (solo frames con inferencia real)
+                    if inferred:
+                        cat_counts = Counter(d['category'] for d in detections)
+                        self._update_stats(detections, detection_stats, cat_counts)
+
+                    # Calcular FPS y progreso
+                    fps_counter += 1
+                    if fps_counter % 30 == 0:
+                        end_time = time.time()
+                        fps = 30 / (end_time - start_time)
+                        start_time = end_time
+
+                        if self.video_source:
+                            # Con salto de decodificación cada frame procesado
+                            # representa vid_stride frames del archivo
+                            frames_advanced = processed_frames * (self.vid_stride if reader_strides else 1)
+                            progress = (frames_advanced / self.total_frames) * 100
+                            # Formato %-style: logging solo construye la cadena
+                            # si el nivel INFO está habilitado
+                            logger.info("Progreso: %d/%d (%.1f%%) - FPS: %.2f",
+                                        frames_advanced, self.total_frames, progress, fps)
+                        else:
+                            logger.info("FPS: %.2f", fps)
+
+                    # Añadir información al frame (HUD re-renderizado a ~media
+                    # cadencia en cámara: el texto solo necesita refrescarse
+                    # para el ojo humano, no por cada frame detectado; en video
+                    # se dibuja siempre porque queda grabado en la salida)
                     if self.video_source:
-                        progress = (processed_frames / self.total_frames) * 100
-                        logger.info(f"Progreso: {processed_frames}/{self.total_frames} ({progress:.1f}%) - FPS: {fps:.2f}")
+                        if cat_counts is None:
+                            cat_counts = Counter(d['category'] for d in detections)
+                        self._add_enhanced_info(processed_frame, detections, fps_counter,
+                                                detection_stats, cat_counts)
+                        processed_frame = self._draw_tracking_info(processed_frame)
+                    elif fps_counter & 1 == 0:
+                        # Frame par: re-renderizar la capa de HUD y componerla
+                        if cat_counts is None:
+                            cat_counts = Counter(d['category'] for d in detections)
+                        if (self._info_overlay is None or
+                                self._info_overlay.shape != processed_frame.shape):
+                            self._info_overlay = np.zeros_like(processed_frame)
+                        else:
+                            self._info_overlay.fill(0)
+                        self._add_enhanced_info(self._info_overlay, detections,
+                                                fps_counter, detection_stats,
+                                                cat_counts)
+                        cv2.add(processed_frame, self._info_overlay, dst=processed_frame)
+                        processed_frame = self._draw_tracking_info(processed_frame)
                     else:
-                        logger.info(f"FPS: {fps:.2f}")
-                
-                # Añadir información al frame
-                self._add_enhanced_info(processed_frame, detections, fps_counter, detection_stats)
-                
-                # Añadir información de tracking
-                processed_frame = self._draw_tracking_info(processed_frame)
-                
-                # Añadir información de progreso para videos
-                if self.video_source:
-                    progress = (processed_frames / self.total_frames) * 100
-                    progress_text = f"Progreso: {processed_frames}/{self.total_frames} ({progress:.1f}%)"
-                    cv2.putText(processed_frame, progress_text, (10, self.frame_height - 50), 
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                
-                # Guardar frame en video de salida si está configurado
-                if self.video_writer:
-                    self.video_writer.write(processed_frame)
-                
-                # Mostrar frame (opcional para videos)
-                if not self.video_source or self.video_source and processed_frames % 5 == 0:  # Mostrar cada 5 frames para videos
-                    cv2.imshow('Detector Mejorado - Alimentos y Objetos', processed_frame)
-                
-                # Manejar teclas (solo para cámara o video con visualización)
-                if not self.video_source:
-                    key = cv2.waitKey(1) & 0xFF
-                    if key == ord('q'):
-                        break
-                    elif key == ord('s'):
-                        self._save_enhanced_screenshot(processed_frame, detections)
-                    elif key == ord('c'):
-                        self._print_stats(detection_stats)
-                    elif key == ord('i'):
-                        self._print_inventory_status()
-                    elif key == ord('r'):
-                        self._force_register_current_detections(detections)
-                    elif key == ord('t'):
-                        self._print_tracking_stats()
-                else:
-                    # Para videos, verificar si se presiona 'q' para cancelar
-                    key = cv2.waitKey(1) & 0xFF
-                    if key == ord('q'):
-                        logger.info("Procesamiento cancelado por el usuario")
-                        break
-                    
+                        # Frame impar: componer las capas cacheadas (un add por
+                        # capa) en vez de dejar el frame sin overlay, que hacía
+                        # parpadear el HUD a media cadencia de la cámara
+                        if (self._info_overlay is not None and
+                                self._info_overlay.shape == processed_frame.shape):
+                            cv2.add(processed_frame, self._info_overlay, dst=processed_frame)
+                        processed_frame = self._draw_tracking_info(processed_frame)
+
+                    # Añadir información de progreso para videos
+                    if self.video_source:
+                        frames_advanced = processed_frames * (self.vid_stride if reader_strides else 1)
+                        progress = (frames_advanced / self.total_frames) * 100
+                        progress_text = f"Progreso: {frames_advanced}/{self.total_frames} ({progress:.1f}%)"
+                        cv2.putText(processed_frame, progress_text, (10, self.frame_height - 50),
+                                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+
+                    # Encolar frame para el hilo de escritura si está configurado
+                    if write_q is not None:
+                        write_q.put(processed_frame)
+
+                    # Mostrar frame (cada 5 frames para videos; en modo headless
+                    # se omite la copia al display y el bombeo de eventos GUI)
+                    if self.display:
+                        display_tick += 1
+                        if display_tick >= display_mod:
+                            display_tick = 0
+                            cv2.imshow('Detector Mejorado - Alimentos y Objetos', processed_frame)
+
+                    # Manejar teclas (solo con visualización activa; en
+                    # headless se sale con Ctrl+C)
+                    if not self.display:
+                        pass
+                    elif not self.video_source:
+                        key = cv2.waitKey(1) & 0xFF
+                        if key == ord('q'):
+                            stop = True
+                            break
+                        elif key == ord('s'):
+                            self._save_enhanced_screenshot(processed_frame, detections)
+                        elif key == ord('c'):
+                            self._print_stats(detection_stats)
+                        elif key == ord('i'):
+                            self._print_inventory_status()
+                        elif key == ord('r'):
+                            self._force_register_current_detections(detections)
+                        elif key == ord('t'):
+                            self._print_tracking_stats()
+                    else:
+                        # Para videos, verificar si se presiona 'q' para cancelar
+                        key = cv2.waitKey(1) & 0xFF
+                        if key == ord('q'):
+                            logger.info("Procesamiento cancelado por el usuario")
+                            stop = True
+                            break
+
         except KeyboardInterrupt:
             logger.info("Detección interrumpida por el usuario")
         except Exception as e:
             logger.error(f"Error durante la detección: {e}")
         finally:
+            # Detener pipeline y vaciar la cola de escritura antes de liberar
+            pipeline_stop.set()
+            self._inf_pool.shutdown(wait=False)
+            if write_q is not None:
+                write_q.put(None)
+                writer_thread.join(timeout=5.0)
+
             # Mostrar estadísticas finales
             self._print_final_stats(detection_stats, processed_frames)
             self.cleanup()
     
-    def _update_stats(self, detections: List[Dict], stats: Dict):
+    def _update_stats(self, detections: List[Dict], stats: Dict,
+                      category_counts: Counter):
         """Actualizar estadísticas de detección"""
         stats['total'] += len(detections)
-        
-        for detection in detections:
-            category = detection['category']
-            if category not in stats['by_category']:
-                stats['by_category'][category] = 0
-            stats['by_category'][category] += 1
+
+        # Counter + Counter corre en C; los conteos por categoría del frame
+        # llegan ya calculados y compartidos con el HUD
+        stats['by_category'].update(category_counts)
     
-    def _add_enhanced_info(self, frame: np.ndarray, detections: List[Dict], 
-                          frame_count: int, stats: Dict):
+    def _add_enhanced_info(self, frame: np.ndarray, detections: List[Dict],
+                          frame_count: int, stats: Dict,
+                          category_counts: Counter):
         """Añadir información mejorada al frame"""
-        height, width = frame.shape[:2]
-        
-        # Contar por categoría
-        category_counts = {}
-        for detection in detections:
-            cat = detection['category']
-            category_counts[cat] = category_counts.get(cat, 0) + 1
-        
-        # Información actual
+        # Dimensiones cacheadas al abrir la fuente: sin re-leer shape por frame
+        height = self.frame_height
+
+
+        # Bloque de Google Sheets: solo se reconstruye si cambia el estado de conexión
+        hud_state = (self.sheets_manager.is_connected,)
+        if self._hud_prefix_cache is None or self._hud_prefix_state != hud_state:
+            if self.sheets_manager.is_connected:
+                self._hud_prefix_cache = [
+                    "--- Google Sheets ---",
+                    "Inventario: ✅ Conectado",
+                    "Registro automático: Activo"
+                ]
+            else:
+                self._hud_prefix_cache = ["Inventario: ❌ Desconectado"]
+            self._hud_prefix_state = hud_state
+
+        # Información actual (plantillas precompiladas, solo interpola valores)
         y_offset = 30
         info_lines = [
-            f"Frame: {frame_count} | Total detectado: {stats['total']}",
-            f"Objetos actuales: {len(detections)}"
+            self._HUD_HEADER_TMPL % (frame_count, stats['total']),
+            self._HUD_OBJECTS_TMPL % len(detections)
         ]
-        
-        # Información de Google Sheets
-        if self.sheets_manager.is_connected:
-            info_lines.extend([
-                f"--- Google Sheets ---",
-                f"Inventario: ✅ Conectado",
-                f"Registro automático: Activo"
-            ])
-        else:
-            info_lines.append("Inventario: ❌ Desconectado")
-        
+        info_lines += self._hud_prefix_cache
+
         # Añadir conteos por categoría
         if category_counts:
             info_lines.append("--- Categorías ---")
-            for category, count in category_counts.items():
-                info_lines.append(f"{category}: {count}")
-        
+            info_lines.extend(self._HUD_CAT_TMPL % kv for kv in category_counts.items())
+
         # Dibujar información
         for i, line in enumerate(info_lines):
             y_pos = y_offset + (i * 25)
-            cv2.putText(frame, line, (10, y_pos), cv2.FONT_HERSHEY_SIMPLEX, 
-                       0.6, (255, 255, 255), 2)
-        
+            cv2.putText(frame, line, (10, y_pos), self._FONT, 0.6, self._WHITE, 2)
+
         # Instrucciones actualizadas
-        instructions = "q:salir | s:screenshot | c:estadisticas | i:inventario | r:registrar | t:tracking"
-        cv2.putText(frame, instructions, (10, height - 20), cv2.FONT_HERSHEY_SIMPLEX, 
-                   0.5, (255, 255, 255), 1)
+        cv2.putText(frame, self._HUD_INSTRUCTIONS, (10, height - 20), self._FONT,
+                   0.5, self._WHITE, 1)
     
     def _save_enhanced_screenshot(self, frame: np.ndarray, detections: List[Dict]):
-        """Guardar screenshot con información detallada"""
+        """Encolar el guardado del screenshot sin frenar el frame siguiente"""
         timestamp = int(time.time())
+
+        # Copias: el buffer del frame se reutiliza en el anillo de captura y
+        # la lista de detecciones se muta frame a frame
+        self._io_pool.submit(self._write_screenshot_sync,
+                             frame.copy(), list(detections), timestamp)
+
+    def _write_screenshot_sync(self, frame: np.ndarray, detections: List[Dict],
+                               timestamp: int):
+        """Codificar y escribir el screenshot (corre en el hilo de E/S)"""
         filename = f"enhanced_detection_{timestamp}.jpg"
-        
+
         cv2.imwrite(filename, frame)
         logger.info(f"Screenshot guardado: {filename}")
-        
+
         # Guardar información detallada
         if detections:
             info_filename = f"enhanced_detections_{timestamp}.txt"
@@ -907,12 +1601,17 @@ class EnhancedFoodObjectDetector:
     
     def _print_stats(self, stats: Dict):
         """Imprimir estadísticas en consola"""
-        print(f"\n=== ESTADÍSTICAS DE DETECCIÓN ===")
-        print(f"Total objetos detectados: {stats['total']}")
-        print(f"Por categoría:")
+        # Acumular las líneas y escribirlas de una vez (una sola llamada de I/O)
+        lines = [
+            "",
+            "=== ESTADÍSTICAS DE DETECCIÓN ===",
+            f"Total objetos detectados: {stats['total']}",
+            "Por categoría:"
+        ]
         for category, count in stats['by_category'].items():
-            print(f"  {category}: {count}")
-        print("=" * 35)
+            lines.append(f"  {category}: {count}")
+        lines.append("=" * 35)
+        sys.stdout.write('\n'.join(lines) + '\n')
     
     def _print_inventory_status(self):
         """Imprimir estado del inventario"""
@@ -962,73 +1661,60 @@ class EnhancedFoodObjectDetector:
         
         print(f"\n🔥 REGISTRO FORZADO - {len(detections)} detecciones")
         print("-" * 50)
-        
-        registered_count = 0
+
+        # Encolar los registros al worker de Sheets y volver de inmediato:
+        # la tecla 'r' ya no congela el video mientras se escriben N filas.
+        # El worker es un solo hilo, así que el par log_detection +
+        # get_last_item_id queda serializado sin locks.
+        info = f"Registro manual forzado - {time.ctime()}"
         for detection in detections:
-            try:
-                item_name = detection['class_name']
-                confidence = detection['confidence']
-                category = detection['category']
-                
-                print(f"📦 Registrando: {item_name} ({category}) - {confidence:.3f}")
-                
-                # Registrar en inventario
-                success = self.sheets_manager.log_detection(
-                    item_name=item_name,
-                    confidence=confidence,
-                    additional_info=f"Registro manual forzado - {time.ctime()}"
-                )
-                
-                if success:
-                    registered_count += 1
-                    # Obtener ID y agregar sinónimos
-                    last_item_id = self.sheets_manager.get_last_item_id()
-                    if last_item_id:
-                        self._add_automatic_synonyms(item_name, last_item_id, category)
-                        print(f"  ✅ Registrado con ID: {last_item_id}")
-                else:
-                    print(f"  ❌ Error en registro")
-                
-                time.sleep(0.5)  # Pausa entre registros
-                
-            except Exception as e:
-                print(f"  ❌ Error registrando {detection.get('class_name', 'unknown')}: {e}")
-        
-        print(f"\n✅ Registro completado: {registered_count}/{len(detections)} productos")
+            item_name = detection['class_name']
+            print(f"📦 Encolando registro: {item_name} ({detection['category']}) "
+                  f"- {detection['confidence']:.3f}")
+            self._enqueue_sheets_op(('manual_register', item_name,
+                                     detection['confidence'],
+                                     detection['category'], info))
+
+        print(f"\n✅ {len(detections)} registros encolados (se completan en segundo plano)")
         print("-" * 50)
     
     def _print_tracking_stats(self):
         """Imprimir estadísticas detalladas del sistema de tracking"""
-        print("=" * 60)
-        print("📊 ESTADÍSTICAS DEL SISTEMA DE TRACKING")
-        print("=" * 60)
-        print(f"Frame actual: {self._frame_counter}")
-        print(f"Objetos siendo tracked: {len(self._tracked_objects)}")
-        print(f"Umbral de desaparición: {self._disappearance_threshold} frames")
-        print(f"Frames mínimos para registro: {self._min_frames_for_registration}")
-        
+        # Con muchos objetos tracked, un print por línea bloquea el loop
+        # principal con N flushes; acumular y escribir en una sola llamada
+        lines = [
+            "=" * 60,
+            "📊 ESTADÍSTICAS DEL SISTEMA DE TRACKING",
+            "=" * 60,
+            f"Frame actual: {self._frame_counter}",
+            f"Objetos siendo tracked: {len(self._tracked_objects)}",
+            f"Umbral de desaparición: {self._disappearance_threshold} frames",
+            f"Frames mínimos para registro: {self._min_frames_for_registration}"
+        ]
+
         if self._tracked_objects:
-            print("\n🎯 OBJETOS TRACKED:")
+            lines.append("\n🎯 OBJETOS TRACKED:")
             for object_key, obj_info in self._tracked_objects.items():
                 detection = obj_info['detection']
                 frames_active = self._frame_counter - obj_info['first_seen_frame']
                 frames_since_seen = self._frame_counter - obj_info['last_seen_frame']
                 status = "✅ REGISTRADO" if obj_info['registered'] else "⏳ PENDIENTE"
-                
-                print(f"  • {detection['class_name']} ({detection['category']})")
-                print(f"    - Estado: {status}")
-                print(f"    - Cantidad: {obj_info['quantity']}")
-                print(f"    - Frames activo: {frames_active}")
-                print(f"    - Último visto: hace {frames_since_seen} frames")
-                print(f"    - Detecciones totales: {obj_info['total_detections']}")
-                print(f"    - Confianza promedio: {obj_info['avg_confidence']:.3f}")
+
+                lines.append(f"  • {detection['class_name']} ({detection['category']})")
+                lines.append(f"    - Estado: {status}")
+                lines.append(f"    - Cantidad: {obj_info['quantity']}")
+                lines.append(f"    - Frames activo: {frames_active}")
+                lines.append(f"    - Último visto: hace {frames_since_seen} frames")
+                lines.append(f"    - Detecciones totales: {obj_info['total_detections']}")
+                lines.append(f"    - Confianza promedio: {obj_info['avg_confidence']:.3f}")
                 if obj_info['item_id']:
-                    print(f"    - ID en inventario: {obj_info['item_id']}")
-                print("")
+                    lines.append(f"    - ID en inventario: {obj_info['item_id']}")
+                lines.append("")
         else:
-            print("🚫 No hay objetos siendo tracked actualmente")
-        
-        print("=" * 60)
+            lines.append("🚫 No hay objetos siendo tracked actualmente")
+
+        lines.append("=" * 60)
+        sys.stdout.write('\n'.join(lines) + '\n')
     
     def _print_final_stats(self, stats: Dict, total_frames: int):
         """Imprimir estadísticas finales del procesamiento"""
@@ -1056,16 +1742,15 @@ class EnhancedFoodObjectDetector:
     
     def cleanup(self):
         """Limpiar recursos"""
-        if self.cap is not None:
-            self.cap.release()
-        cv2.destroyAllWindows()
-        logger.info("Recursos liberados correctamente")
-    
-    def cleanup(self):
-        """Limpiar recursos"""
-        if hasattr(self, 'cap') and self.cap:
-            self.cap.release()
-        if hasattr(self, 'video_writer') and self.video_writer:
+        # Esperar a que terminen los screenshots pendientes antes de salir
+        io_pool = getattr(self, '_io_pool', None)
+        if io_pool is not None:
+            io_pool.shutdown(wait=True)
+
+        cap = getattr(self, 'cap', None)
+        if cap is not None:
+            cap.release()
+        if self.video_writer:
             self.video_writer.release()
             logger.info("Video de salida guardado correctamente")
         cv2.destroyAllWindows()
@@ -1081,6 +1766,9 @@ def main():
     parser.add_argument('--output', '-o', type=str, help='Ruta del video de salida con detecciones')
     parser.add_argument('--confidence', '-c', type=float, default=0.4, help='Umbral de confianza (default: 0.4)')
     parser.add_argument('--model', '-m', type=str, default='yolov8n.pt', help='Ruta del modelo YOLO (default: yolov8n.pt)')
+    parser.add_argument('--batch', '-b', type=int, default=1, help='Frames por lote de inferencia (default: 1)')
+    parser.add_argument('--stride', '-s', type=int, default=1, help='Procesar 1 de cada N frames con YOLO (default: 1)')
+    parser.add_argument('--no-display', action='store_true', help='No mostrar ventana de previsualización (modo headless)')
     
     args = parser.parse_args()
     
@@ -1104,7 +1792,10 @@ def main():
             model_path=args.model,
             confidence_threshold=args.confidence,
             video_source=args.video,
-            output_video_path=args.output
+            output_video_path=args.output,
+            batch_size=args.batch,
+            vid_stride=args.stride,
+            display=not args.no_display
         )
         
         # Mostrar configuración
@@ -3,21 +3,56 @@
 
 import gspread
 from google.oauth2.service_account import Credentials
+import atexit
+import itertools
 import json
 import os
 import logging
+import random
+import threading
+from collections import deque
+from functools import lru_cache
 from typing import Dict, List
 import time
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Secuencia por proceso para los item_id: con las escrituras en lote ya no
+# hay pausas entre registros, y dos detecciones en el mismo instante no
+# deben compartir id
+_detection_seq = itertools.count()
+
+# Mapa palabra-clave -> categoría: una sola pasada en vez de cuatro
+# escaneos con any() por item
+_CATEGORY_MAP = {
+    'galleta': 'Snacks', 'cookie': 'Snacks', 'dulce': 'Snacks', 'chocolate': 'Snacks',
+    'bebida': 'Bebidas', 'lata': 'Bebidas', 'refresco': 'Bebidas', 'agua': 'Bebidas',
+    'comida': 'Alimentos', 'alimento': 'Alimentos',
+}
+
+
+@lru_cache(maxsize=1024)
+def _determine_category(item_name):
+    """Determinar la categoría de un item (memoizado: en una cámara en vivo
+    se repiten los mismos nombres una y otra vez)"""
+    item_lower = item_name.lower()
+    for keyword, category in _CATEGORY_MAP.items():
+        if keyword in item_lower:
+            return category
+    return "General"
+
 class GoogleSheetsManager:
     """
     Gestor que respeta la estructura existente del spreadsheet
     sin modificar encabezados ni estructura establecida
     """
-    
+
+    # Evitar re-escribir la plantilla de credenciales si ya se generó en
+    # este proceso (p.ej. managers instanciados repetidamente en un REPL)
+    _template_written = False
+
+
     def __init__(self, credentials_file: str = "calm-segment-credentials.json", 
                  spreadsheet_name: str = "Detecciones_Alimentos",
                  spreadsheet_id: str = None):
@@ -33,23 +68,65 @@ class GoogleSheetsManager:
         self.spreadsheet_name = spreadsheet_name
         self.spreadsheet_id = spreadsheet_id
         self.client = None
-        self.sheet = None  # Hoja principal identificada automáticamente
-        self.worksheet = None  # Mantener compatibilidad
-        self.sheet_structure = {}  # Mapeo de estructura existente
-        self.main_headers = []  # Encabezados de la hoja principal
+        # Estructura analizada de forma perezosa en el primer acceso a
+        # sheet/main_headers/sheet_structure: conectar no obliga a bajar
+        # el contenido de todas las hojas si el caller aún no las usa
+        self._sheet = None  # Hoja principal identificada automáticamente
+        self._worksheet = None  # Mantener compatibilidad
+        self._sheet_structure = None  # Mapeo de estructura existente
+        self._main_headers = []  # Encabezados de la hoja principal
+        self._row_builders = []  # Generadores de valor por columna
+        # El primer acceso puede llegar a la vez desde el hilo escritor y
+        # el principal; el lock garantiza un solo análisis completo
+        self._structure_lock = threading.Lock()
         self.is_connected = False
-        
+
+        # Buffers de filas pendientes: cada append_row era un round-trip
+        # HTTP a la API de Sheets; agrupando en append_rows se envían N
+        # filas en una sola llamada (y se respeta mejor la cuota de escritura)
+        self._pending_rows = []       # hoja principal
+        self._pending_bitacora = []   # hoja Bitacora
+        self._pending_sinonimos = []  # hoja Sinonimos
+        self._max_batch = 50
+        self._flush_interval = 2.0  # segundos
+        self._last_flush = time.monotonic()
+
+        # Caché de get_all_values por hoja (ws.id -> (timestamp, values)):
+        # cada mutación descargaba la hoja completa aunque el flujo normal
+        # sea casi todo appends
+        self._values_cache = {}
+        self._values_cache_ttl = 30.0  # segundos
+        self._id_index = None  # item_id -> fila, construido perezosamente
+        self._syn_set = None  # pares (term, item_id) de sinónimos conocidos
+
+        # Timestamps de peticiones recientes para auto-limitarnos antes
+        # de que Google responda 429
+        self._req_times = deque()
+
+        # Hilo escritor en segundo plano: los registros encolan y vuelven
+        # de inmediato; el round-trip a Google ocurre fuera del bucle de
+        # detección. El lock protege el intercambio de buffers al enviar
+        self._flush_lock = threading.Lock()
+        self._writer_wake = threading.Event()
+        self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer.start()
+
+        # No perder filas pendientes al salir del proceso
+        atexit.register(self.flush)
+
         # Intentar conectar y analizar estructura
         self._connect()
     
     def _connect(self):
         """Conectar a Google Sheets y analizar estructura existente"""
         try:
-            # Verificar si existe el archivo de credenciales
-            if not os.path.exists(self.credentials_file):
+            # Verificar si existe el archivo de credenciales (lexists: un
+            # solo stat sin seguir symlinks)
+            if not os.path.lexists(self.credentials_file):
                 logger.warning(f"Archivo de credenciales no encontrado: {self.credentials_file}")
-                logger.info("Creando archivo de credenciales de ejemplo...")
-                self._create_credentials_template()
+                if not GoogleSheetsManager._template_written:
+                    logger.info("Creando archivo de credenciales de ejemplo...")
+                    self._create_credentials_template()
                 return
             
             # Definir el scope necesario
@@ -65,7 +142,25 @@ class GoogleSheetsManager:
             
             # Crear cliente
             self.client = gspread.authorize(credentials)
-            
+
+            # Pool de conexiones keep-alive: las ráfagas de llamadas a la
+            # API reutilizan la conexión TLS en vez de pagar un handshake
+            # por petición
+            try:
+                from requests.adapters import HTTPAdapter
+
+                session = getattr(self.client, 'session', None)
+                if session is None:
+                    # gspread >= 5.12 guarda la sesión en el http_client
+                    session = getattr(getattr(self.client, 'http_client', None),
+                                      'session', None)
+                if session is not None:
+                    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16)
+                    session.mount('https://', adapter)
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo configurar el pool de conexiones: {e}")
+
+
             # Intentar obtener el spreadsheet ID desde las credenciales si no se proporcionó
             if not self.spreadsheet_id:
                 try:
@@ -96,9 +191,8 @@ class GoogleSheetsManager:
                     self.spreadsheet = self.client.create(self.spreadsheet_name)
                     self.spreadsheet.share('', perm_type='anyone', role='reader')
             
-            # Analizar estructura existente sin modificarla
-            self._analyze_existing_structure()
-            
+            # La estructura existente se analiza perezosamente en el
+            # primer acceso a sheet/main_headers/sheet_structure
             self.is_connected = True
             logger.info("✅ Conectado exitosamente a Google Sheets")
             logger.info(f"📊 Spreadsheet: {self.spreadsheet.url}")
@@ -122,78 +216,170 @@ class GoogleSheetsManager:
             "client_x509_cert_url": "https://www.googleapis.com/robot/v1/metadata/x509/tu-service-account%40tu-proyecto.iam.gserviceaccount.com"
         }
         
-        with open(self.credentials_file, 'w') as f:
+        # Escribir a un temporal y renombrar (atómico): nunca queda una
+        # plantilla a medio escribir si el proceso muere aquí
+        tmp_path = self.credentials_file + ".tmp"
+        with open(tmp_path, 'w') as f:
             json.dump(template, f, indent=2)
-        
+        os.replace(tmp_path, self.credentials_file)
+        GoogleSheetsManager._template_written = True
+
         logger.info(f"📝 Archivo de credenciales de ejemplo creado: {self.credentials_file}")
         logger.info("🔧 Por favor, reemplaza los valores con tus credenciales reales de Google Cloud")
         logger.info("🌐 Instrucciones: https://docs.gspread.org/en/latest/oauth2.html")
     
-    def _analyze_existing_structure(self):
+    def _ensure_structure(self):
+        """Analizar la estructura en el primer uso (una vez por proceso)"""
+        if self._sheet_structure is not None or not self.is_connected:
+            return
+        with self._structure_lock:
+            # Otro hilo pudo completar el análisis mientras esperábamos
+            if self._sheet_structure is not None:
+                return
+            structure = {}
+            self._analyze_existing_structure(structure)
+            # Publicar solo al final: un lector sin lock nunca ve una
+            # estructura a medias con la hoja principal sin resolver
+            self._sheet_structure = structure
+
+    @property
+    def sheet(self):
+        """Hoja principal, identificada en el primer acceso"""
+        self._ensure_structure()
+        return self._sheet
+
+    @property
+    def worksheet(self):
+        """Alias de la hoja principal (compatibilidad)"""
+        self._ensure_structure()
+        return self._worksheet
+
+    @property
+    def main_headers(self):
+        """Encabezados de la hoja principal"""
+        self._ensure_structure()
+        return self._main_headers
+
+    @property
+    def sheet_structure(self):
+        """Mapeo de la estructura existente por hoja"""
+        self._ensure_structure()
+        return self._sheet_structure or {}
+
+    def _analyze_existing_structure(self, structure):
         """Analizar y mapear la estructura existente sin cambiarla"""
         try:
             worksheets = self.spreadsheet.worksheets()
             logger.info(f"📊 Análisis de estructura: {len(worksheets)} hojas encontradas")
-            
-            for ws in worksheets:
+
+            # Una sola llamada batchGet trae el contenido de todas las
+            # hojas; antes eran dos round-trips (row_values + get_all_values)
+            # por cada una
+            response = self.spreadsheet.values_batch_get(
+                [f"'{ws.title}'" for ws in worksheets])
+            value_ranges = response.get('valueRanges', [])
+
+            for ws, value_range in zip(worksheets, value_ranges):
                 try:
-                    headers = ws.row_values(1)
+                    all_values = value_range.get('values', [])
+                    headers = all_values[0] if all_values else []
                     if headers:
                         # Contar filas con datos
-                        all_values = ws.get_all_values()
                         data_rows = len([row for row in all_values[1:] if any(cell.strip() for cell in row)])
-                        
+
                         # Guardar estructura para uso posterior
-                        self.sheet_structure[ws.title] = {
+                        structure[ws.title] = {
                             'worksheet': ws,
                             'headers': headers,
                             'data_rows': data_rows,
                             'total_rows': ws.row_count,
                             'total_cols': ws.col_count
                         }
-                        
+
+                        # Aprovechar la lectura para calentar la caché
+                        self._values_cache[ws.id] = (time.monotonic(), all_values)
+
                         logger.debug(f"📄 {ws.title}: {len(headers)} encabezados, {data_rows} filas de datos")
-                        
+
                 except Exception as e:
                     logger.warning(f"⚠️ Error analizando hoja {ws.title}: {e}")
             
             # Identificar hoja principal para detecciones
-            self._identify_main_sheet()
-                    
+            self._identify_main_sheet(structure)
+
         except Exception as e:
             logger.error(f"❌ Error analizando estructura: {e}")
-    
-    def _identify_main_sheet(self):
+
+    def _identify_main_sheet(self, structure):
         """Identificar cuál hoja usar para las detecciones"""
-        self.sheet = None
-        
+        self._sheet = None
+
         # Prioridad: Inventario > primera hoja con datos
-        if 'Inventario' in self.sheet_structure:
-            self.sheet = self.sheet_structure['Inventario']['worksheet']
-            self.main_headers = self.sheet_structure['Inventario']['headers']
-            self.worksheet = self.sheet  # Mantener compatibilidad
+        if 'Inventario' in structure:
+            self._sheet = structure['Inventario']['worksheet']
+            self._main_headers = structure['Inventario']['headers']
+            self._worksheet = self._sheet  # Mantener compatibilidad
             logger.info(f"✅ Hoja principal identificada: Inventario")
         else:
             # Usar la primera hoja que tenga datos
-            for sheet_name, info in self.sheet_structure.items():
+            for sheet_name, info in structure.items():
                 if info['data_rows'] >= 0:  # Cualquier hoja, incluso sin datos
-                    self.sheet = info['worksheet']
-                    self.main_headers = info['headers']
-                    self.worksheet = self.sheet  # Mantener compatibilidad
+                    self._sheet = info['worksheet']
+                    self._main_headers = info['headers']
+                    self._worksheet = self._sheet  # Mantener compatibilidad
                     logger.info(f"✅ Hoja principal identificada: {sheet_name}")
                     break
         
-        if self.sheet:
-            logger.info(f"📋 Encabezados detectados: {self.main_headers[:5]}..." if len(self.main_headers) > 5 else f"📋 Encabezados: {self.main_headers}")
+        if self._sheet:
+            # Compilar una sola vez el mapeo encabezado -> valor: los
+            # encabezados no cambian en la vida de la hoja, así que
+            # log_detection no necesita re-escanearlos por cada fila
+            self._row_builders = [self._resolve_builder(h) for h in self._main_headers]
+            logger.info(f"📋 Encabezados detectados: {self._main_headers[:5]}..." if len(self._main_headers) > 5 else f"📋 Encabezados: {self._main_headers}")
         else:
             logger.error("❌ No se pudo identificar hoja principal")
+
+    def _resolve_builder(self, header):
+        """Resolver qué valor corresponde a una columna según su encabezado"""
+        header_lower = header.lower()
+
+        if 'id' in header_lower and 'item' in header_lower:
+            return lambda ctx: ctx['item_id']
+        if 'name' in header_lower or 'nombre' in header_lower:
+            return lambda ctx: ctx['item_name']
+        if 'category' in header_lower or 'categoria' in header_lower:
+            return lambda ctx: ctx['category']
+        if 'confidence' in header_lower or 'confianza' in header_lower:
+            return lambda ctx: ctx['confidence']
+        if 'quantity' in header_lower or 'cantidad' in header_lower:
+            return lambda ctx: ctx['quantity']
+        if 'source' in header_lower or 'origen' in header_lower:
+            return lambda ctx: "camera"
+        if 'event' in header_lower or 'evento' in header_lower:
+            return lambda ctx: "detection"
+        if 'timestamp' in header_lower or 'fecha' in header_lower or 'created' in header_lower:
+            return lambda ctx: ctx['timestamp']
+        if 'updated' in header_lower:
+            return lambda ctx: ctx['timestamp']
+        if 'note' in header_lower or 'observ' in header_lower:
+            return lambda ctx: ctx['note']
+        if 'location' in header_lower or 'ubicacion' in header_lower:
+            return lambda ctx: "camera_view"
+        if 'last_seen' in header_lower:
+            return lambda ctx: ctx['timestamp']
+        if 'last_event' in header_lower:
+            return lambda ctx: "detection"
+
+        # Campo no reconocido, dejar vacío
+        return lambda ctx: ""
     
     def _format_headers_for_sheet(self, sheet, num_cols):
         """Aplicar formato a los encabezados de una hoja específica"""
         try:
-            # Generar rango dinámicamente
-            end_col = chr(ord('A') + num_cols - 1)  # A, B, C, etc.
-            range_str = f'A1:{end_col}1'
+            # Generar rango dinámicamente; rowcol_to_a1 codifica bien las
+            # columnas de dos letras (AA, AB, ...), donde chr(ord('A')+n)
+            # se rompía pasada la Z
+            range_str = f'A1:{gspread.utils.rowcol_to_a1(1, num_cols)}'
             
             sheet.format(range_str, {
                 'textFormat': {'bold': True, 'fontSize': 10},
@@ -213,75 +399,262 @@ class GoogleSheetsManager:
         except Exception as e:
             logger.error(f"❌ Error formateando encabezados de hoja específica: {e}")
     
+    def _throttle(self):
+        """Auto-limitar a ~55 peticiones/min, por debajo de la cuota"""
+        now = time.monotonic()
+        while self._req_times and now - self._req_times[0] > 60:
+            self._req_times.popleft()
+
+        if len(self._req_times) >= 55:
+            wait = 60 - (now - self._req_times[0])
+            if wait > 0:
+                logger.info(f"⏳ Cerca del límite de peticiones; esperando {wait:.1f}s")
+                time.sleep(wait)
+
+    def _api_call(self, func, *args, **kwargs):
+        """
+        Ejecutar una llamada a la API con auto-limitación y reintentos
+
+        Solo se duerme cuando hace falta: ante un 429 o un 5xx se reintenta
+        con backoff exponencial (más jitter); cualquier otro error se
+        propaga al manejo normal del método llamante.
+        """
+        for attempt in range(5):
+            self._throttle()
+            try:
+                result = func(*args, **kwargs)
+                self._req_times.append(time.monotonic())
+                return result
+            except gspread.exceptions.APIError as e:
+                self._req_times.append(time.monotonic())
+                status = getattr(getattr(e, 'response', None), 'status_code', None)
+                retryable = status == 429 or (status is not None and status >= 500)
+                if not retryable or attempt == 4:
+                    raise
+                wait = min(2 ** attempt, 30) + random.random()
+                logger.warning(f"⚠️ API respondió {status}; reintento en {wait:.1f}s")
+                time.sleep(wait)
+
+    def _cached_values(self, ws):
+        """get_all_values de una hoja con caché TTL en proceso"""
+        entry = self._values_cache.get(ws.id)
+        now = time.monotonic()
+        if entry and now - entry[0] < self._values_cache_ttl:
+            return entry[1]
+
+        values = self._api_call(ws.get_all_values)
+        self._values_cache[ws.id] = (now, values)
+        return values
+
+    def _invalidate_values(self, ws):
+        """Descartar la caché de una hoja tras una escritura no-append"""
+        self._values_cache.pop(ws.id, None)
+        if self.sheet and ws.id == self.sheet.id:
+            self._id_index = None
+
+    def _splice_into_cache(self, ws, rows):
+        """Añadir filas recién enviadas a la caché para mantenerla caliente"""
+        entry = self._values_cache.get(ws.id)
+        if entry:
+            entry[1].extend(rows)
+        if self.sheet and ws.id == self.sheet.id:
+            self._id_index = None
+
+    def _get_id_index(self):
+        """
+        Índice item_id -> número de fila de la hoja principal
+
+        Se construye una vez por ventana de caché, de modo que una ráfaga de
+        eliminaciones resuelve cada id en O(1) en vez de re-escanear la
+        columna A por llamada. Se invalida con cualquier escritura.
+        """
+        if self._id_index is None:
+            entry = self._values_cache.get(self.sheet.id)
+            if entry and time.monotonic() - entry[0] < self._values_cache_ttl:
+                col_a = [row[0] if row else "" for row in entry[1]]
+            else:
+                col_a = self._api_call(self.sheet.col_values, 1)
+
+            index = {}
+            for i, cell in enumerate(col_a[1:], start=2):  # Saltar encabezados
+                if cell and cell not in index:
+                    index[cell] = i
+            self._id_index = index
+        return self._id_index
+
+    def _get_syn_set(self, sinonimos_sheet):
+        """
+        Conjunto de pares (term_lower, item_id) de sinónimos conocidos
+
+        Se carga con una sola lectura en el primer uso; después cada
+        comprobación de existencia es un lookup O(1) en memoria en vez de
+        descargar y escanear la hoja completa.
+        """
+        if self._syn_set is None:
+            existing_data = self._cached_values(sinonimos_sheet)
+            self._syn_set = {(row[0].lower(), row[1])
+                             for row in existing_data[1:] if len(row) >= 2}
+            self._syn_set.update((row[0].lower(), row[1])
+                                 for row in self._pending_sinonimos)
+        return self._syn_set
+
+    # Filas con las que se crean (y se hacen crecer) las hojas auxiliares:
+    # crear con 100 filas obligaba a Sheets a expandir la cuadrícula cada
+    # pocos appends, y cada expansión implícita es una llamada de metadatos
+    _EXPECTED_ROWS = 10000
+
+    def _ensure_capacity(self, ws, incoming):
+        """Crecer la cuadrícula de una vez cuando el lote se acerca al tope"""
+        try:
+            entry = self._values_cache.get(ws.id)
+            used = len(entry[1]) if entry else 0
+            if used and used + incoming >= ws.row_count * 0.9:
+                self._api_call(ws.add_rows, self._EXPECTED_ROWS)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo ampliar la hoja {ws.title}: {e}")
+
+    def _get_or_create_bitacora(self):
+        """Obtener la hoja Bitacora, creándola con sus encabezados si falta"""
+        try:
+            return self.spreadsheet.worksheet("Bitacora")
+        except:
+            bitacora_sheet = self.spreadsheet.add_worksheet(
+                title="Bitacora", rows=str(self._EXPECTED_ROWS), cols="9")
+            headers_bitacora = [
+                'timestamp', 'item_id', 'name', 'delta_qty', 'new_qty',
+                'event', 'source', 'payload_id', 'note'
+            ]
+            bitacora_sheet.append_row(headers_bitacora)
+            self._format_headers_for_sheet(bitacora_sheet, len(headers_bitacora))
+            return bitacora_sheet
+
+    def _get_or_create_sinonimos(self):
+        """Obtener la hoja Sinonimos, creándola con sus encabezados si falta"""
+        try:
+            return self.spreadsheet.worksheet("Sinonimos")
+        except:
+            sinonimos_sheet = self.spreadsheet.add_worksheet(
+                title="Sinonimos", rows=str(self._EXPECTED_ROWS), cols="3")
+            headers_sinonimos = ['term', 'item_id', 'category']
+            sinonimos_sheet.append_row(headers_sinonimos)
+            self._format_headers_for_sheet(sinonimos_sheet, len(headers_sinonimos))
+            return sinonimos_sheet
+
+    def _writer_loop(self):
+        """Hilo escritor: envía los buffers cada intervalo o al despertarlo"""
+        while True:
+            self._writer_wake.wait(self._flush_interval)
+            self._writer_wake.clear()
+            if (self._pending_rows or self._pending_bitacora or
+                    self._pending_sinonimos):
+                self.flush()
+
+    def flush(self):
+        """Enviar todas las filas pendientes, un append_rows por hoja"""
+        # Intercambiar los buffers bajo lock; el envío ocurre fuera para
+        # no bloquear a quien encola mientras viaja la petición
+        with self._flush_lock:
+            rows, self._pending_rows = self._pending_rows, []
+            bitacora_rows, self._pending_bitacora = self._pending_bitacora, []
+            sinonimo_rows, self._pending_sinonimos = self._pending_sinonimos, []
+
+        try:
+            if rows and self.sheet:
+                self._ensure_capacity(self.sheet, len(rows))
+                self._api_call(self.sheet.append_rows, rows,
+                               value_input_option="USER_ENTERED")
+                self._splice_into_cache(self.sheet, rows)
+                logger.debug(f"📝 {len(rows)} filas enviadas a la hoja principal")
+                rows = []
+
+            if bitacora_rows:
+                bitacora_sheet = self._get_or_create_bitacora()
+                self._ensure_capacity(bitacora_sheet, len(bitacora_rows))
+                self._api_call(bitacora_sheet.append_rows, bitacora_rows,
+                               value_input_option="USER_ENTERED")
+                self._splice_into_cache(bitacora_sheet, bitacora_rows)
+                bitacora_rows = []
+
+            if sinonimo_rows:
+                sinonimos_sheet = self._get_or_create_sinonimos()
+                self._ensure_capacity(sinonimos_sheet, len(sinonimo_rows))
+                self._api_call(sinonimos_sheet.append_rows, sinonimo_rows,
+                               value_input_option="USER_ENTERED")
+                self._splice_into_cache(sinonimos_sheet, sinonimo_rows)
+                sinonimo_rows = []
+
+            self._last_flush = time.monotonic()
+            return True
+
+        except Exception as e:
+            logger.error(f"❌ Error enviando filas pendientes: {e}")
+            return False
+
+        finally:
+            # Lo que no llegó a enviarse vuelve al frente del buffer para
+            # el siguiente intento
+            if rows or bitacora_rows or sinonimo_rows:
+                with self._flush_lock:
+                    self._pending_rows[:0] = rows
+                    self._pending_bitacora[:0] = bitacora_rows
+                    self._pending_sinonimos[:0] = sinonimo_rows
+
+    def _maybe_flush(self):
+        """Despertar al hilo escritor si ya hay lote suficiente"""
+        pending = (len(self._pending_rows) + len(self._pending_bitacora) +
+                   len(self._pending_sinonimos))
+        if pending >= self._max_batch:
+            self._writer_wake.set()
+
     def log_detection(self, item_name, confidence, quantity=1, additional_info=None):
         """
         Registrar detección usando la estructura existente sin modificarla
+
+        Returns:
+            El item_id generado (truthy) si se encoló, False si falló.
+            Devolver el id evita que el llamador tenga que releer la hoja
+            completa solo para averiguarlo.
         """
         if not self.sheet or not self.main_headers:
             logger.error("❌ No hay hoja principal disponible")
             return False
         
         try:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
+            # Un solo datetime.now(): el timestamp visible y el id salen
+            # del mismo instante, sin la cadena de .replace() que asignaba
+            # tres strings intermedios por detección. El id lleva
+            # microsegundos más un contador de proceso: registros
+            # consecutivos en el mismo segundo quedan distinguibles
+            now = datetime.now()
+            timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
+
+            # Valores de esta detección; los builders precompilados en
+            # _identify_main_sheet deciden qué va en cada columna
+            ctx = {
+                'item_id': (f"DET_{now.strftime('%Y%m%d%H%M%S%f')}"
+                            f"_{next(_detection_seq)}"),
+                'item_name': item_name,
+                'category': self._determine_category(item_name),
+                'confidence': f"{confidence:.3f}",
+                'quantity': str(quantity),
+                'timestamp': timestamp,
+                'note': additional_info or ""
+            }
+
             # Crear fila compatible con la estructura existente
-            nueva_fila = []
-            
-            # Mapear campos según los encabezados existentes
-            for header in self.main_headers:
-                header_lower = header.lower()
-                
-                if 'id' in header_lower and 'item' in header_lower:
-                    # item_id
-                    nueva_fila.append(f"DET_{int(timestamp.replace('-', '').replace(':', '').replace(' ', ''))}")
-                elif 'name' in header_lower or 'nombre' in header_lower:
-                    # name/nombre
-                    nueva_fila.append(item_name)
-                elif 'category' in header_lower or 'categoria' in header_lower:
-                    # category/categoria
-                    category = self._determine_category(item_name)
-                    nueva_fila.append(category)
-                elif 'confidence' in header_lower or 'confianza' in header_lower:
-                    # confidence/confianza
-                    nueva_fila.append(f"{confidence:.3f}")
-                elif 'quantity' in header_lower or 'cantidad' in header_lower:
-                    # quantity/cantidad
-                    nueva_fila.append(str(quantity))
-                elif 'source' in header_lower or 'origen' in header_lower:
-                    # source/origen
-                    nueva_fila.append("camera")
-                elif 'event' in header_lower or 'evento' in header_lower:
-                    # event/evento
-                    nueva_fila.append("detection")
-                elif 'timestamp' in header_lower or 'fecha' in header_lower or 'created' in header_lower:
-                    # timestamp/fecha/created
-                    nueva_fila.append(timestamp)
-                elif 'updated' in header_lower:
-                    # updated
-                    nueva_fila.append(timestamp)
-                elif 'note' in header_lower or 'observ' in header_lower:
-                    # note/observaciones
-                    nueva_fila.append(additional_info or "")
-                elif 'location' in header_lower or 'ubicacion' in header_lower:
-                    # location/ubicacion
-                    nueva_fila.append("camera_view")
-                elif 'last_seen' in header_lower:
-                    # last_seen_at
-                    nueva_fila.append(timestamp)
-                elif 'last_event' in header_lower:
-                    # last_event
-                    nueva_fila.append("detection")
-                else:
-                    # Campo no reconocido, dejar vacío
-                    nueva_fila.append("")
-            
-            # Añadir la fila al final
-            self.sheet.append_row(nueva_fila)
+            nueva_fila = [builder(ctx) for builder in self._row_builders]
             
+            # Encolar la fila bajo lock; sin él, un append que cruce el
+            # intercambio de buffers de flush() caería en la lista ya
+            # enviada y la fila se perdería en silencio
+            with self._flush_lock:
+                self._pending_rows.append(nueva_fila)
+            self._maybe_flush()
+
             logger.info(f"✅ Detección registrada: {item_name} (confianza: {confidence:.3f})")
-            logger.debug(f"📝 Fila añadida con {len(nueva_fila)} campos")
-            
-            return True
+            logger.debug(f"📝 Fila encolada con {len(nueva_fila)} campos")
+
+            return ctx['item_id']
             
         except Exception as e:
             logger.error(f"❌ Error registrando detección: {e}")
@@ -289,20 +662,14 @@ class GoogleSheetsManager:
     
     def _determine_category(self, item_name):
         """Determinar categoría del item"""
-        item_lower = item_name.lower()
-        
-        if any(word in item_lower for word in ['galleta', 'cookie', 'dulce', 'chocolate']):
-            return "Snacks"
-        elif any(word in item_lower for word in ['bebida', 'lata', 'refresco', 'agua']):
-            return "Bebidas"
-        elif any(word in item_lower for word in ['comida', 'alimento']):
-            return "Alimentos"
-        else:
-            return "General"
+        return _determine_category(item_name)
     
     def read_existing_data(self, sheet_name=None):
         """Leer datos existentes de una hoja específica"""
         try:
+            # Enviar lo pendiente para que la lectura vea todas las filas
+            self.flush()
+
             if sheet_name and sheet_name in self.sheet_structure:
                 ws = self.sheet_structure[sheet_name]['worksheet']
                 headers = self.sheet_structure[sheet_name]['headers']
@@ -315,20 +682,17 @@ class GoogleSheetsManager:
                 return []
             
             # Leer todos los datos
-            all_values = ws.get_all_values()
+            all_values = self._cached_values(ws)
             if len(all_values) <= 1:
                 logger.info("📊 No hay datos en la hoja")
                 return []
             
-            # Convertir a lista de diccionarios
-            data = []
-            for row in all_values[1:]:  # Saltar encabezados
-                if any(cell.strip() for cell in row):  # Solo filas con datos
-                    record = {}
-                    for i, header in enumerate(headers):
-                        if i < len(row):
-                            record[header] = row[i]
-                    data.append(record)
+            # Convertir a lista de diccionarios en una sola pasada:
+            # dict(zip(...)) empareja encabezado y celda en C, sin el
+            # bucle por columna con chequeo de índice de antes
+            data = [dict(zip(headers, row))
+                    for row in all_values[1:]  # Saltar encabezados
+                    if any(map(str.strip, row))]  # Solo filas con datos
             
             logger.info(f"📊 Leídos {len(data)} registros de {ws.title}")
             return data
@@ -350,23 +714,76 @@ class GoogleSheetsManager:
             return False
         
         try:
-            # Buscar la fila del item
-            all_values = self.sheet.get_all_values()
-            
-            for i, row in enumerate(all_values[1:], start=2):  # Empezar desde fila 2 (saltar encabezados)
-                if len(row) > 0 and row[0] == item_id:  # Asumir que item_id está en la primera columna
-                    # Eliminar la fila
-                    self.sheet.delete_rows(i)
-                    logger.info(f"✅ Item eliminado del inventario: {item_id} (razón: {reason})")
-                    return True
-            
-            logger.warning(f"⚠️ Item no encontrado en inventario: {item_id}")
-            return False
+            # Enviar lo pendiente antes de buscar: el item podría estar
+            # todavía en el buffer
+            self.flush()
+
+            # Resolver la fila con el índice id -> fila (O(1) por item)
+            row = self._get_id_index().get(item_id)
+            if row is None:
+                logger.warning(f"⚠️ Item no encontrado en inventario: {item_id}")
+                return False
+
+            # Eliminar la fila (la numeración cambia: descartar caché)
+            self._api_call(self.sheet.delete_rows, row)
+            self._invalidate_values(self.sheet)
+            logger.info(f"✅ Item eliminado del inventario: {item_id} (razón: {reason})")
+            return True
             
         except Exception as e:
             logger.error(f"❌ Error eliminando item del inventario: {e}")
             return False
     
+    def remove_items_from_inventory(self, item_ids, reason="manual_removal"):
+        """
+        Eliminar varios items del inventario en una sola llamada a la API
+
+        Args:
+            item_ids: Lista de IDs de items a eliminar
+            reason: Razón de la eliminación
+        """
+        if not self.sheet:
+            logger.error("❌ No hay hoja principal disponible")
+            return False
+
+        if not item_ids:
+            return True
+
+        try:
+            self.flush()
+
+            index = self._get_id_index()
+            rows = sorted((index[item_id] for item_id in item_ids
+                           if item_id in index), reverse=True)
+            missing = [item_id for item_id in item_ids if item_id not in index]
+            for item_id in missing:
+                logger.warning(f"⚠️ Item no encontrado en inventario: {item_id}")
+
+            if not rows:
+                return False
+
+            # Un solo batch_update con un deleteDimension por fila, en orden
+            # descendente para que los índices no se desplacen entre sí
+            requests = [{
+                'deleteDimension': {
+                    'range': {
+                        'sheetId': self.sheet.id,
+                        'dimension': 'ROWS',
+                        'startIndex': row - 1,
+                        'endIndex': row
+                    }
+                }
+            } for row in rows]
+
+            self._api_call(self.spreadsheet.batch_update, {'requests': requests})
+            self._invalidate_values(self.sheet)
+            logger.info(f"✅ {len(rows)} items eliminados del inventario (razón: {reason})")
+            return True
+
+        except Exception as e:
+            logger.error(f"❌ Error eliminando items del inventario: {e}")
+            return False
+
     def log_removal_to_bitacora(self, item_id, item_name, reason="manual_removal"):
         """
         Registrar la eliminación en la hoja de bitácora
@@ -377,38 +794,27 @@ class GoogleSheetsManager:
             reason: Razón de la eliminación
         """
         try:
-            # Obtener o crear hoja de bitácora
-            bitacora_sheet = None
-            try:
-                bitacora_sheet = self.spreadsheet.worksheet("Bitacora")
-            except:
-                # Crear hoja de bitácora si no existe
-                bitacora_sheet = self.spreadsheet.add_worksheet(title="Bitacora", rows="100", cols="9")
-                headers_bitacora = [
-                    'timestamp', 'item_id', 'name', 'delta_qty', 'new_qty', 
-                    'event', 'source', 'payload_id', 'note'
-                ]
-                bitacora_sheet.append_row(headers_bitacora)
-                self._format_headers_for_sheet(bitacora_sheet, len(headers_bitacora))
-            
-            if bitacora_sheet:
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                bitacora_row = [
-                    timestamp,
-                    item_id,
-                    item_name,
-                    "-1",  # delta_qty (eliminación)
-                    "0",   # new_qty (ya no está)
-                    "removed",  # event
-                    "system",  # source
-                    f"REM_{int(time.time())}",  # payload_id
-                    f"Item eliminado: {reason}"  # note
-                ]
-                
-                bitacora_sheet.append_row(bitacora_row)
-                logger.info(f"✅ Eliminación registrada en bitácora: {item_name}")
-                return True
-            
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            bitacora_row = [
+                timestamp,
+                item_id,
+                item_name,
+                "-1",  # delta_qty (eliminación)
+                "0",   # new_qty (ya no está)
+                "removed",  # event
+                "system",  # source
+                f"REM_{int(time.time())}",  # payload_id
+                f"Item eliminado: {reason}"  # note
+            ]
+
+            # Encolar bajo lock (ver log_detection); la hoja Bitacora se
+            # resuelve/crea al enviar el lote
+            with self._flush_lock:
+                self._pending_bitacora.append(bitacora_row)
+            self._maybe_flush()
+            logger.info(f"✅ Eliminación registrada en bitácora: {item_name}")
+            return True
+
         except Exception as e:
             logger.error(f"❌ Error registrando eliminación en bitácora: {e}")
             return False
@@ -423,46 +829,81 @@ class GoogleSheetsManager:
             category: Categoría (opcional)
         """
         try:
-            # Obtener o crear hoja de sinónimos
-            sinonimos_sheet = None
-            try:
-                sinonimos_sheet = self.spreadsheet.worksheet("Sinonimos")
-            except:
-                # Crear hoja de sinónimos si no existe
-                sinonimos_sheet = self.spreadsheet.add_worksheet(title="Sinonimos", rows="100", cols="3")
-                headers_sinonimos = ['term', 'item_id', 'category']
-                sinonimos_sheet.append_row(headers_sinonimos)
-                self._format_headers_for_sheet(sinonimos_sheet, len(headers_sinonimos))
-            
-            if sinonimos_sheet:
-                # Verificar si ya existe el sinónimo
-                existing_data = sinonimos_sheet.get_all_values()
-                for row in existing_data[1:]:  # Saltar encabezados
-                    if len(row) >= 2 and row[0].lower() == term.lower() and row[1] == item_id:
-                        logger.info(f"📝 Sinónimo ya existe: {term} -> {item_id}")
-                        return True
-                
-                # Agregar nuevo sinónimo
-                new_row = [term, item_id]
-                if category:
-                    new_row.append(category)
-                
-                sinonimos_sheet.append_row(new_row)
-                logger.info(f"✅ Sinónimo agregado: {term} -> {item_id}")
+            sinonimos_sheet = self._get_or_create_sinonimos()
+
+            # Verificar si ya existe el sinónimo: lookup O(1) en el
+            # conjunto cacheado (incluye los pendientes de envío)
+            key = (term.lower(), item_id)
+            syn_set = self._get_syn_set(sinonimos_sheet)
+            if key in syn_set:
+                logger.info(f"📝 Sinónimo ya existe: {term} -> {item_id}")
                 return True
-                
+
+            # Encolar nuevo sinónimo
+            new_row = [term, item_id]
+            if category:
+                new_row.append(category)
+
+            with self._flush_lock:
+                self._pending_sinonimos.append(new_row)
+            syn_set.add(key)
+            self._maybe_flush()
+            logger.info(f"✅ Sinónimo agregado: {term} -> {item_id}")
+            return True
+
         except Exception as e:
             logger.error(f"❌ Error agregando sinónimo: {e}")
             return False
     
+    def add_synonyms_batch(self, synonyms):
+        """
+        Agregar varios sinónimos en una sola escritura
+
+        Args:
+            synonyms: Lista de tuplas (term, item_id, category)
+        """
+        if not synonyms:
+            return True
+
+        try:
+            sinonimos_sheet = self._get_or_create_sinonimos()
+
+            # El conjunto cacheado ya indexa existentes + pendientes
+            existing = self._get_syn_set(sinonimos_sheet)
+
+            new_rows = []
+            for term, item_id, category in synonyms:
+                key = (term.lower(), item_id)
+                if key in existing:
+                    continue
+                existing.add(key)
+                new_rows.append([term, item_id, category or ""])
+
+            if new_rows:
+                # Una sola llamada a la API para todo el lote
+                self._api_call(sinonimos_sheet.append_rows, new_rows)
+                logger.info(f"✅ {len(new_rows)} sinónimos agregados en lote")
+
+            return True
+
+        except Exception as e:
+            logger.error(f"❌ Error agregando sinónimos en lote: {e}")
+            return False
+
     def get_last_item_id(self):
         """
         Obtener el ID del último item agregado al inventario
         """
         try:
-            data = self.read_existing_data()
-            if data and len(data) > 0:
-                return data[-1].get('item_id', None)
+            if not self.sheet:
+                return None
+
+            # Basta con la última fila de la caché: materializar toda la
+            # hoja como lista de diccionarios era un desperdicio
+            self.flush()
+            all_values = self._cached_values(self.sheet)
+            if len(all_values) > 1 and all_values[-1]:
+                return all_values[-1][0] or None
             return None
         except Exception as e:
             logger.error(f"❌ Error obteniendo último item ID: {e}")
@@ -477,8 +918,11 @@ class GoogleSheetsManager:
             return False
         
         try:
+            # Enviar lo pendiente antes de leer/actualizar
+            self.flush()
+
             # Obtener todos los datos
-            all_data = self.sheet.get_all_values()
+            all_data = self._cached_values(self.sheet)
             if not all_data:
                 logger.error("❌ No hay datos en la hoja")
                 return False
@@ -514,28 +958,70 @@ class GoogleSheetsManager:
                 logger.error(f"❌ No se encontró item con ID: {item_id}")
                 return False
             
+            # Acumular las celdas a escribir y enviarlas en un solo
+            # batch_update: antes eran hasta tres update_cell (tres
+            # round-trips HTTP) más un sleep para la cuota
+            updates = []
+
             # Actualizar cantidad
             if quantity_col is not None:
-                self.sheet.update_cell(row_to_update, quantity_col + 1, str(new_quantity))
-                logger.info(f"✅ Cantidad actualizada para {item_id}: {new_quantity}")
-            
+                updates.append({
+                    'range': gspread.utils.rowcol_to_a1(row_to_update, quantity_col + 1),
+                    'values': [[str(new_quantity)]]
+                })
+
             # Actualizar timestamp de modificación si existe la columna
             if updated_col is not None:
                 timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                self.sheet.update_cell(row_to_update, updated_col + 1, timestamp)
-            
-            # Si hay información adicional y columna para notas
+                updates.append({
+                    'range': gspread.utils.rowcol_to_a1(row_to_update, updated_col + 1),
+                    'values': [[timestamp]]
+                })
+
+            # Si hay información adicional y columna para notas, la nota
+            # actual ya está en all_data (sin lectura extra)
             if additional_info:
                 for i, header in enumerate(headers):
                     if 'note' in header.lower() or 'nota' in header.lower() or 'info' in header.lower():
                         current_info = all_data[row_to_update - 1][i] if len(all_data[row_to_update - 1]) > i else ""
                         new_info = f"{current_info}; {additional_info}" if current_info else additional_info
-                        self.sheet.update_cell(row_to_update, i + 1, new_info)
+                        updates.append({
+                            'range': gspread.utils.rowcol_to_a1(row_to_update, i + 1),
+                            'values': [[new_info]]
+                        })
                         break
-            
-            time.sleep(1)  # Pausa para evitar rate limiting
+
+            if updates:
+                self._api_call(self.sheet.batch_update, updates,
+                               value_input_option="USER_ENTERED")
+                self._invalidate_values(self.sheet)
+                logger.info(f"✅ Cantidad actualizada para {item_id}: {new_quantity}")
+
             return True
             
         except Exception as e:
             logger.error(f"❌ Error actualizando cantidad del item {item_id}: {e}")
             return False
+
+
+# Instancia compartida del gestor: cada construcción re-autentica contra
+# Google y vuelve a pedir los metadatos del spreadsheet, así que los
+# distintos componentes del proceso deberían reutilizar la misma
+_DEFAULT_MANAGER = None
+_default_manager_lock = threading.Lock()
+
+
+def get_default_manager(**kwargs):
+    """
+    Obtener el GoogleSheetsManager compartido del proceso
+
+    Se construye perezosamente en la primera llamada (con los kwargs que
+    esta reciba) y las siguientes devuelven la misma instancia. El lock
+    evita que dos hilos autentiquen a la vez en la primera llamada.
+    """
+    global _DEFAULT_MANAGER
+    if _DEFAULT_MANAGER is None:
+        with _default_manager_lock:
+            if _DEFAULT_MANAGER is None:
+                _DEFAULT_MANAGER = GoogleSheetsManager(**kwargs)
+    return _DEFAULT_MANAGER
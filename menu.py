@@ -5,32 +5,44 @@ Script de demostración que muestra las capacidades del sistema
 
 import time
 import os
+import subprocess
+import sys
+
+# Textos estáticos construidos una vez en el import: cada tick del menú
+# hace un solo print en lugar de ~10 llamadas por bloque
+_BANNER_STR = "\n".join([
+    "=" * 70,
+    "🍎🥤🍽️ DETECTOR DE ALIMENTOS Y OBJETOS CON YOLO",
+    "=" * 70,
+    "Un sistema completo para detectar:",
+    "  • Alimentos (frutas, comida preparada, postres)",
+    "  • Bebidas y contenedores (botellas, vasos)",
+    "  • Utensilios de cocina (bowls, cubiertos)",
+    "  • Objetos de contexto (laptop, teclado, libros)",
+    "=" * 70,
+])
+
+_MENU_STR = "\n".join([
+    "\n🎮 ¿Qué detector quieres probar?",
+    "1. 🚀 Detector Ultra-Simple (todo en un archivo)",
+    "2. ⚡ Detector Simple (básico y rápido)",
+    "3. 🌟 Detector Mejorado (RECOMENDADO - más objetos)",
+    "4. 🔧 Detector Completo (funciones avanzadas)",
+    "5. 🎯 Demo Avanzado (con estadísticas)",
+    "6. 📊 Recopilador de Datos",
+    "7. 🧪 Verificar Sistema",
+    "8. ❓ Ayuda",
+    "0. 👋 Salir",
+    "-" * 50,
+])
 
 def print_banner():
     """Mostrar banner del sistema"""
-    print("=" * 70)
-    print("🍎🥤🍽️ DETECTOR DE ALIMENTOS Y OBJETOS CON YOLO")
-    print("=" * 70)
-    print("Un sistema completo para detectar:")
-    print("  • Alimentos (frutas, comida preparada, postres)")
-    print("  • Bebidas y contenedores (botellas, vasos)")
-    print("  • Utensilios de cocina (bowls, cubiertos)")
-    print("  • Objetos de contexto (laptop, teclado, libros)")
-    print("=" * 70)
+    print(_BANNER_STR)
 
 def show_menu():
     """Mostrar menú de opciones"""
-    print("\n🎮 ¿Qué detector quieres probar?")
-    print("1. 🚀 Detector Ultra-Simple (todo en un archivo)")
-    print("2. ⚡ Detector Simple (básico y rápido)")
-    print("3. 🌟 Detector Mejorado (RECOMENDADO - más objetos)")
-    print("4. 🔧 Detector Completo (funciones avanzadas)")
-    print("5. 🎯 Demo Avanzado (con estadísticas)")
-    print("6. 📊 Recopilador de Datos")
-    print("7. 🧪 Verificar Sistema")
-    print("8. ❓ Ayuda")
-    print("0. 👋 Salir")
-    print("-" * 50)
+    print(_MENU_STR)
 
 def run_detector(choice):
     """Ejecutar el detector seleccionado"""
@@ -55,7 +67,7 @@ def run_detector(choice):
             print("")
         
         # Mostrar comando para ejecutar
-        print(f"Ejecutando: python3 {script}")
+        print(f"Ejecutando: {sys.executable} {script}")
         print("")
         print("💡 Consejos:")
         if choice == '3':
@@ -69,7 +81,10 @@ def run_detector(choice):
         print("=" * 50)
         
         try:
-            os.system(f"python3 {script}")
+            # Ejecutar el script directamente con el mismo intérprete, sin
+            # pasar por /bin/sh (un proceso menos y sin depender de que
+            # "python3" exista en el PATH)
+            subprocess.run([sys.executable, script])
         except KeyboardInterrupt:
             print("\n⚠️ Detector interrumpido por el usuario")
     
@@ -90,24 +105,28 @@ def verify_system():
     print("\n🧪 Verificando sistema...")
     print("=" * 30)
     
+    # Un solo scandir devuelve todo el directorio, en vez de un stat
+    # por archivo verificado
+    present = {entry.name for entry in os.scandir('.')}
+
     # Verificar entorno virtual
-    if os.path.exists('food_detection_env'):
+    if 'food_detection_env' in present:
         print("✅ Entorno virtual encontrado")
     else:
         print("❌ Entorno virtual no encontrado")
         print("   Ejecuta: ./install.sh")
         return
-    
+
     # Verificar archivos principales
     important_files = [
         'enhanced_food_detector.py',
-        'simple_food_detector.py', 
+        'simple_food_detector.py',
         'requirements.txt',
         'config.py'
     ]
-    
+
     for file in important_files:
-        if os.path.exists(file):
+        if file in present:
             print(f"✅ {file}")
         else:
             print(f"❌ {file}")
@@ -1,17 +1,50 @@
 import cv2
 import numpy as np
+import torch
 from ultralytics import YOLO
 import time
 import os
+import queue
+import threading
 from typing import List, Dict, Tuple
 
 class SimpleFoodDetector:
     """
     Versión simplificada del detector de alimentos para pruebas rápidas
     """
-    
+
+    # Frames por lote de inferencia: un solo predict por lote mantiene la
+    # GPU ocupada en vez de lanzar un kernel pequeño por frame
+    _BATCH = 8
+
     def __init__(self):
-        self.model = YOLO("yolov8n.pt")  # Descarga automáticamente si no existe
+        # FP16 solo en GPUs con tensor cores (Volta+, CC >= 7.0): en Pascal
+        # y anteriores la media precisión no acelera nada
+        self._use_half = (torch.cuda.is_available() and
+                          torch.cuda.get_device_capability()[0] >= 7)
+
+        # Reutilizar el engine TensorRT si ya existe; si no, exportarlo una
+        # sola vez (FP16 aprovecha los tensor cores y reduce la latencia a
+        # cerca de la mitad frente a PyTorch FP32). La API de predicción no
+        # cambia: Ultralytics despacha al engine de forma transparente
+        engine_path = "yolov8n.engine"
+        if os.path.exists(engine_path):
+            self.model = YOLO(engine_path)
+        elif torch.cuda.is_available():
+            try:
+                YOLO("yolov8n.pt").export(format="engine", half=True,
+                                          imgsz=640, device=0,
+                                          dynamic=True, batch=self._BATCH)
+                self.model = YOLO(engine_path)
+            except Exception as e:
+                print(f"No se pudo exportar a TensorRT: {e}")
+                self.model = YOLO("yolov8n.pt")  # Descarga automáticamente si no existe
+                # Respaldo PyTorch: convertir los pesos a FP16 igualmente,
+                # que recupera buena parte de la ganancia de tensor cores
+                if self._use_half:
+                    self.model.model.half()
+        else:
+            self.model = YOLO("yolov8n.pt")  # Descarga automáticamente si no existe
         # Expandir a más objetos relacionados con alimentos
         self.food_classes = {
             # Alimentos principales
@@ -22,6 +55,22 @@ class SimpleFoodDetector:
             # Utensilios
             64: 'bowl', 65: 'fork', 66: 'knife', 67: 'spoon'
         }
+        # Clases de interés como bitmap indexado por id (COCO tiene 80):
+        # el filtro pasa a ser un gather booleano directo, sin np.isin ni
+        # sondas de diccionario por detección. Los nombres van en un array
+        # paralelo para resolver las etiquetas con el mismo gather
+        self._food_mask = np.zeros(80, dtype=bool)
+        self._food_mask[list(self.food_classes)] = True
+        self._food_labels = np.empty(80, dtype=object)
+        for class_id, name in self.food_classes.items():
+            self._food_labels[class_id] = name
+
+        # Buffers pinned/GPU reutilizados para subir el lote con copia
+        # asíncrona; se asignan de forma perezosa en el primer lote
+        self._pinned = None
+        self._gpu = None
+        self._resized = None
+        self._copy_stream = torch.cuda.Stream() if torch.cuda.is_available() else None
         
     def run(self):
         """Ejecutar detección simple"""
@@ -31,40 +80,137 @@ class SimpleFoodDetector:
         print("Detecta: alimentos, bebidas, botellas, vasos y utensilios")
         print("Presiona 'q' para salir")
         
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-                
-            # Detectar objetos
-            results = self.model(frame, verbose=False)
-            
-            # Procesar detecciones
-            for result in results:
+        # Pipeline de tres etapas (captura → inferencia → dibujo) con colas
+        # acotadas: la GPU no se queda parada mientras la cámara entrega el
+        # siguiente frame ni mientras imshow pinta el anterior, y las colas
+        # llenas frenan a la etapa previa (back-pressure)
+        frames_q = queue.Queue(maxsize=4)
+        display_q = queue.Queue(maxsize=self._BATCH * 2)
+        stop = threading.Event()
+
+        def _reader():
+            """Etapa 1: capturar frames y encolarlos"""
+            while not stop.is_set():
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                try:
+                    frames_q.put(frame, timeout=0.5)
+                except queue.Full:
+                    continue
+            stop.set()
+
+        def _displayer():
+            """Etapa 3: dibujar detecciones ya filtradas y mostrar cada frame"""
+            while not stop.is_set():
+                try:
+                    frame, detections = display_q.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+
+                for name, confidence, x1, y1, x2, y2 in detections:
+                    # Dibujar detección
+                    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                    label = f"{name}: {confidence:.2f}"
+                    cv2.putText(frame, label, (x1, y1-10),
+                              cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+
+                cv2.imshow('Detector de Alimentos', frame)
+
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    stop.set()
+
+        reader = threading.Thread(target=_reader, daemon=True)
+        displayer = threading.Thread(target=_displayer, daemon=True)
+        reader.start()
+        displayer.start()
+
+        # Etapa 2 (este hilo): acumular un lote y hacer un solo predict
+        batch = []
+        while not stop.is_set():
+            try:
+                batch.append(frames_q.get(timeout=0.5))
+            except queue.Empty:
+                continue
+            if len(batch) < self._BATCH:
+                continue
+
+            # Detectar objetos (una inferencia para todo el lote). Con CUDA
+            # el lote entra por los buffers pinned reutilizados; las cajas
+            # vuelven en coordenadas 640x640 y se reescalan al frame original
+            staged = self._stage_batch(batch)
+            results = self.model(staged, half=self._use_half, verbose=False)
+            if staged is batch:
+                sx = sy = 1.0
+            else:
+                h0, w0 = batch[0].shape[:2]
+                sx, sy = w0 / 640.0, h0 / 640.0
+
+            for frame, result in zip(batch, results):
+                detections = []
                 boxes = result.boxes
-                if boxes is not None:
-                    for box in boxes:
-                        class_id = int(box.cls)
-                        confidence = float(box.conf)
-                        
-                        # Solo mostrar objetos de interés con confianza > 0.4
-                        if class_id in self.food_classes and confidence > 0.4:
-                            x1, y1, x2, y2 = map(int, box.xyxy[0])
-                            
-                            # Dibujar detección
-                            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                            label = f"{self.food_classes[class_id]}: {confidence:.2f}"
-                            cv2.putText(frame, label, (x1, y1-10), 
-                                      cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-            
-            cv2.imshow('Detector de Alimentos', frame)
-            
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
-        
+                if boxes is not None and len(boxes):
+                    # Bajar los tensores de una sola vez y filtrar en NumPy:
+                    # el bucle por caja cruzaba el puente Python↔Torch en
+                    # cada campo de cada detección
+                    cls = boxes.cls.cpu().numpy().astype(np.int32)
+                    conf = boxes.conf.cpu().numpy()
+                    xyxy = (boxes.xyxy.cpu().numpy() *
+                            (sx, sy, sx, sy)).astype(np.int32)
+
+                    # Solo objetos de interés con confianza > 0.4
+                    mask = (conf > 0.4) & self._food_mask[cls]
+                    for name, confidence, (x1, y1, x2, y2) in zip(
+                            self._food_labels[cls[mask]].tolist(),
+                            conf[mask].tolist(), xyxy[mask].tolist()):
+                        detections.append((name, confidence, x1, y1, x2, y2))
+
+                while not stop.is_set():
+                    try:
+                        display_q.put((frame, detections), timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+            batch = []
+
+        stop.set()
+        reader.join(timeout=1.0)
+        displayer.join(timeout=1.0)
         cap.release()
         cv2.destroyAllWindows()
 
+    def _stage_batch(self, frames):
+        """
+        Subir el lote a GPU desde memoria pinned con copia asíncrona
+
+        Cada frame se redimensiona sobre un buffer preasignado y se copia
+        al tensor pinned (BGR→RGB, HWC→CHW); la transferencia H2D viaja en
+        uint8 por un stream dedicado y la normalización a [0,1] corre en
+        GPU. Así no se asigna un buffer de staging nuevo por iteración.
+        Sin CUDA se devuelve la lista tal cual y Ultralytics preprocesa.
+        """
+        if self._copy_stream is None:
+            return frames
+
+        n = len(frames)
+        if self._pinned is None:
+            self._pinned = torch.empty((self._BATCH, 3, 640, 640),
+                                       dtype=torch.uint8, pin_memory=True)
+            self._gpu = torch.empty_like(self._pinned, device='cuda')
+            self._resized = np.empty((640, 640, 3), dtype=np.uint8)
+
+        for i, frame in enumerate(frames):
+            cv2.resize(frame, (640, 640), dst=self._resized,
+                       interpolation=cv2.INTER_LINEAR)
+            rgb = np.ascontiguousarray(self._resized[:, :, ::-1])
+            self._pinned[i].copy_(torch.from_numpy(rgb).permute(2, 0, 1))
+
+        with torch.cuda.stream(self._copy_stream):
+            self._gpu[:n].copy_(self._pinned[:n], non_blocking=True)
+        torch.cuda.current_stream().wait_stream(self._copy_stream)
+
+        return self._gpu[:n].float().div_(255.0)
+
 if __name__ == "__main__":
     detector = SimpleFoodDetector()
     detector.run()
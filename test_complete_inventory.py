@@ -69,31 +69,25 @@ def main():
     for i, producto in enumerate(productos_nuevos, 1):
         print(f"📦 {i}/3 Agregando: {producto['name']}")
         
-        success = manager.log_detection(
+        # log_detection devuelve el item_id generado: releer toda la hoja
+        # tras cada inserción solo para recuperar el id era una lectura
+        # O(hoja) por escritura
+        item_id = manager.log_detection(
             item_name=producto['name'],
             confidence=producto['confidence'],
             additional_info=producto['info']
         )
-        
-        if success:
-            # Obtener el item_id generado (último registro)
-            data = manager.read_existing_data()
-            if data:
-                ultimo_item = data[-1]
-                item_id = ultimo_item.get('item_id', f"DET_{int(time.time())}")
-                items_agregados.append({
-                    'item_id': item_id,
-                    'name': producto['name'],
-                    'confidence': producto['confidence']
-                })
-                print(f"  ✅ Producto agregado con ID: {item_id}")
-            else:
-                print(f"  ⚠️ No se pudo obtener el ID del producto")
+
+        if item_id:
+            items_agregados.append({
+                'item_id': item_id,
+                'name': producto['name'],
+                'confidence': producto['confidence']
+            })
+            print(f"  ✅ Producto agregado con ID: {item_id}")
         else:
             print(f"  ❌ Error agregando producto")
-        
-        time.sleep(1)  # Pausa entre inserciones
-    
+
     print(f"\n📊 Productos agregados: {len(items_agregados)}")
     print()
     
@@ -112,13 +106,14 @@ def main():
             ('papas', items_agregados[2]['item_id'] if len(items_agregados) > 2 else 'DET_003', 'Snacks')
         ]
         
-        for i, (termino, item_id, categoria) in enumerate(sinonimos_data, 1):
-            success = manager.add_synonym(termino, item_id, categoria)
-            if success:
-                print(f"  ✅ {i}/6 Sinónimo agregado: '{termino}' -> {item_id}")
-            else:
-                print(f"  ❌ {i}/6 Error agregando sinónimo: '{termino}'")
-            time.sleep(0.5)  # Pausa para evitar rate limiting
+        # Una sola escritura para los 6 sinónimos: N llamadas pequeñas con
+        # pausas anti rate-limit se convierten en un append_rows único y
+        # las pausas sobran
+        success = manager.add_synonyms_batch(sinonimos_data)
+        if success:
+            print(f"  ✅ {len(sinonimos_data)} sinónimos agregados en una sola escritura")
+        else:
+            print(f"  ❌ Error agregando sinónimos en lote")
     else:
         print("⚠️ No hay productos para agregar sinónimos")
     